@@ -1,11 +1,33 @@
 import json
 import argparse
+import os
+import sys
+import tarfile
+import tempfile
+import zipfile
 from pathlib import Path
 import shutil
 
+import check
 
-def add_vendordep(vendordep_filename):
-    vendordep_contents = json.loads(vendordep_filename.read_bytes())
+
+class MetadataIndex:
+    """The YEAR_metadata.json files, each loaded once and indexed by UUID"""
+
+    def __init__(self, root=Path()):
+        self.root = root
+        self.years = {}
+
+    def get(self, year):
+        if year not in self.years:
+            metadata_filename = self.root / f"{year}_metadata.json"
+            metadata_contents = json.loads(metadata_filename.read_bytes())
+            self.years[year] = {lib["uuid"]: lib for lib in metadata_contents}
+        return self.years[year]
+
+
+def vendordep_destination(name, contents, metadata, root=Path()):
+    vendordep_contents = json.loads(contents)
     # Uses dict default value as a fallback, remove after 2026
     year = vendordep_contents.get("wpilibYear", vendordep_contents.get("frcYear"))
     if year is None:
@@ -13,29 +35,149 @@ def add_vendordep(vendordep_filename):
             "Vendordep file does not contain a year. Please add a wpilibYear field to the vendordep file."
         )
 
-    metadata_filename = Path(f"{year}_metadata.json")
-    metadata_contents = json.loads(metadata_filename.read_bytes())
-
-    for metadata_lib in metadata_contents:
-        if metadata_lib["uuid"] == vendordep_contents["uuid"]:
-            break
-    else:
+    if vendordep_contents["uuid"] not in metadata.get(year):
         raise Exception(
             "This appears to be a new library that does not have metadata associated with it. Can not automatically update"
         )
 
-    vendordep_destination = Path(f"{year}/{vendordep_filename.name}")
-    shutil.copy(vendordep_filename, vendordep_destination)
+    return root / year / name
+
+
+def add_vendordep(vendordep_filename):
+    destination = vendordep_destination(
+        vendordep_filename.name, vendordep_filename.read_bytes(), MetadataIndex()
+    )
+    shutil.copy(vendordep_filename, destination)
+
+
+def read_inputs(paths):
+    """Returns (inputs, failures): (source, name, contents) for every
+    vendordep in paths, which may be vendordep files, directories of them, or
+    zip/tar archives of them, and (source, error) for every path that could
+    not be read."""
+    inputs = []
+    failures = []
+    for path in paths:
+        if not path.exists():
+            failures.append((str(path), "does not exist"))
+        elif path.is_dir():
+            for file in sorted(path.rglob("*.json")):
+                inputs.append((str(file), file.name, file.read_bytes()))
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and info.filename.endswith(".json"):
+                        inputs.append(
+                            (f"{path}:{info.filename}", Path(info.filename).name, zf.read(info))
+                        )
+        elif path.suffix != ".json" and tarfile.is_tarfile(path):
+            with tarfile.open(path) as tf:
+                for member in tf.getmembers():
+                    if member.isfile() and member.name.endswith(".json"):
+                        inputs.append(
+                            (f"{path}:{member.name}", Path(member.name).name, tf.extractfile(member).read())
+                        )
+        else:
+            inputs.append((str(path), path.name, path.read_bytes()))
+    return inputs, failures
+
+
+def add_vendordeps(paths, root=Path()):
+    """Adds every vendordep in paths (see read_inputs) to its bundle directory.
+
+    Every file is validated first: it must name a bundle and a library that
+    has metadata, and pass the offline checks of check.py.  Only if all of
+    them pass are they moved into place; if anything fails, nothing is
+    changed.  Returns the list of (source, error) failures.
+    """
+    metadata = MetadataIndex(root)
+    inputs, failures = read_inputs(paths)
+    destinations = {}
+    for source, name, contents in inputs:
+        try:
+            destination = vendordep_destination(name, contents, metadata, root)
+        except Exception as e:
+            failures.append((source, str(e)))
+            continue
+        if destination in destinations and destinations[destination][1] != contents:
+            failures.append(
+                (source, f"conflicts with {destinations[destination][0]}, which is also added as {destination}")
+            )
+            continue
+        destinations[destination] = (source, contents)
+
+    # Stage the files in the same layout they will have in the repo (the
+    # checks compare wpilibYear with the parent directory), on the same
+    # filesystem so they can be moved into place atomically.
+    staging = Path(tempfile.mkdtemp(dir=root, prefix=".add_vendordep-"))
+    try:
+        staged = {}
+        for destination, (_, contents) in destinations.items():
+            staged_file = staging / "new" / destination.relative_to(root)
+            staged_file.parent.mkdir(parents=True, exist_ok=True)
+            staged_file.write_bytes(contents)
+            staged[destination] = staged_file
+
+        if staged:
+            check.parse_args(["--lint"] + [str(f) for f in staged.values()])
+        for destination, staged_file in staged.items():
+            report = check.check_one(str(staged_file), capture=True)
+            if report.errors:
+                source = destinations[destination][0]
+                messages = "".join(text for stream, text in report.output if stream == "stderr")
+                messages = messages.replace(str(staged_file), str(destination))
+                failures.append((source, f"{report.errors} errors:\n{messages.rstrip()}"))
+
+        if failures:
+            return failures
+
+        # Move everything into place, keeping what was replaced so a failure
+        # part way through can be rolled back.
+        moved = []
+        try:
+            for destination, staged_file in staged.items():
+                backup = None
+                if destination.exists():
+                    backup = staging / "old" / destination.relative_to(root)
+                    backup.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(destination, backup)
+                moved.append((destination, backup))
+                os.replace(staged_file, destination)
+        except BaseException:
+            for destination, backup in reversed(moved):
+                if backup is not None:
+                    os.replace(backup, destination)
+                else:
+                    destination.unlink(missing_ok=True)
+            raise
+        for destination in staged:
+            print(f"added {destination}")
+        return failures
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
 
 
 def main():
     parser = argparse.ArgumentParser(
-        "Generates one or more vendordep repository bundles for publication"
+        "Adds vendordep files to their bundle directories"
+    )
+    parser.add_argument("--vendordep_file", type=Path, action="append", default=[])
+    parser.add_argument(
+        "inputs",
+        type=Path,
+        nargs="*",
+        help="Vendordep files, directories of them, or zip/tar archives of them, all added together or not at all",
     )
-    parser.add_argument("--vendordep_file", type=Path)
     args = parser.parse_args()
+    if not args.vendordep_file and not args.inputs:
+        parser.error("no vendordep files given")
 
-    add_vendordep(args.vendordep_file)
+    failures = add_vendordeps(args.vendordep_file + args.inputs)
+    for source, message in failures:
+        print(f"{source}: {message}", file=sys.stderr)
+    if failures:
+        print("nothing was added", file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
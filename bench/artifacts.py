@@ -0,0 +1,279 @@
+"""
+Synthetic maven artifacts for the check.py benchmarks.
+
+Everything is generated from a seed, so the same parameters always give
+byte-identical artifacts.  The shared libraries are real (if empty) ELF and
+PE files with the sections check.py inspects, padded with a mix of random
+and zero bytes so they compress like real binaries.
+"""
+
+import hashlib
+import io
+import json
+import os
+import random
+import struct
+import zipfile
+
+# ELF e_machine and the EF_ARM_ABI_FLOAT_* e_flags for each linux arch
+ELF_ARCHES = {
+    'x86-64': (True, 62, 0),
+    'arm64': (True, 183, 0),
+    'systemcore': (True, 183, 0),
+    'athena': (False, 40, 0x05000200),
+    'arm32': (False, 40, 0x05000400),
+}
+
+PE_MACHINES = {
+    'x86-64': 0x8664,
+    'arm64': 0xaa64,
+    'x86': 0x14c,
+}
+
+def filler(rng, size):
+    """size bytes that deflate to roughly a third, like machine code"""
+    out = bytearray()
+    while len(out) < size:
+        n = min(rng.randrange(64, 4096), size - len(out))
+        if rng.random() < 0.35:
+            out += rng.randbytes(n)
+        else:
+            out += bytes([rng.randrange(256)]) * n
+    return bytes(out)
+
+def make_elf(rng, arch, size, needed, symbols):
+    """A shared library with .dynamic, .dynsym and a .text filler section"""
+    is64, machine, flags = ELF_ARCHES[arch]
+    dynstr = bytearray(b'\0')
+    offsets = {}
+    for name in needed + symbols:
+        if name not in offsets:
+            offsets[name] = len(dynstr)
+            dynstr += name.encode() + b'\0'
+
+    if is64:
+        dyn_fmt, sym_fmt, shdr_fmt, ehsize = '<qQ', '<IBBHQQ', '<IIQQQQIIQQ', 64
+    else:
+        dyn_fmt, sym_fmt, shdr_fmt, ehsize = '<iI', '<IIIBBH', '<IIIIIIIIII', 52
+    dynamic = b''.join(struct.pack(dyn_fmt, 1, offsets[n]) for n in needed) + struct.pack(dyn_fmt, 0, 0)
+    dynsym = bytearray(struct.calcsize(sym_fmt))
+    for name in symbols:
+        # global function defined in .text (section 4)
+        if is64:
+            dynsym += struct.pack(sym_fmt, offsets[name], 0x12, 0, 4, 0x1000, 16)
+        else:
+            dynsym += struct.pack(sym_fmt, offsets[name], 0x1000, 16, 0x12, 0, 4)
+    shstrtab = b'\0.dynstr\0.dynamic\0.dynsym\0.text\0.shstrtab\0'
+
+    fixed = ehsize + len(dynstr) + len(dynamic) + len(dynsym) + len(shstrtab) + 6 * struct.calcsize(shdr_fmt)
+    text = filler(rng, max(size - fixed, 0))
+
+    # (name, type, data, link, entsize)
+    sections = [
+        (1, 3, bytes(dynstr), 0, 0),
+        (9, 6, dynamic, 1, struct.calcsize(dyn_fmt)),
+        (18, 11, bytes(dynsym), 1, struct.calcsize(sym_fmt)),
+        (26, 1, text, 0, 0),
+        (32, 3, shstrtab, 0, 0),
+    ]
+    body = bytearray()
+    headers = [struct.pack(shdr_fmt, *[0] * 10)]
+    for name, sh_type, data, link, entsize in sections:
+        offset = ehsize + len(body)
+        headers.append(struct.pack(shdr_fmt, name, sh_type, 0, 0, offset, len(data), link, 1 if sh_type == 11 else 0, 1, entsize))
+        body += data
+    shoff = ehsize + len(body)
+
+    ident = b'\x7fELF' + bytes([2 if is64 else 1, 1, 1, 0]) + bytes(8)
+    if is64:
+        header = ident + struct.pack('<HHIQQQIHHHHHH', 3, machine, 1, 0, 0, shoff, flags, ehsize, 0, 0, 64, len(headers), 5)
+    else:
+        header = ident + struct.pack('<HHIIIIIHHHHHH', 3, machine, 1, 0, 0, shoff, flags, ehsize, 0, 0, 40, len(headers), 5)
+    return header + bytes(body) + b''.join(headers)
+
+def align(n, alignment):
+    return (n + alignment - 1) // alignment * alignment
+
+def make_pe(rng, arch, size, imports):
+    """A PE32+ DLL with a .text filler section and an import table.
+
+    imports maps each imported DLL name to a list of function names.
+    """
+    file_align, section_align = 0x200, 0x1000
+    headers_size = align(0x40 + 4 + 20 + 240 + 2 * 40, file_align)
+    text = filler(rng, max(align(size - headers_size - file_align, file_align), file_align))
+    text_rva = section_align
+    idata_rva = text_rva + align(len(text), section_align)
+
+    # import descriptors, then per DLL: lookup table, address table, names
+    dlls = list(imports.items())
+    offset = (len(dlls) + 1) * 20
+    layout = []
+    for dll, functions in dlls:
+        ilt = offset
+        offset += (len(functions) + 1) * 8
+        iat = offset
+        offset += (len(functions) + 1) * 8
+        names = []
+        for function in functions:
+            names.append(offset)
+            offset = align(offset + 2 + len(function) + 1, 2)
+        dll_name = offset
+        offset += len(dll) + 1
+        layout.append((ilt, iat, names, dll_name))
+    idata = bytearray(offset)
+    for n, ((dll, functions), (ilt, iat, names, dll_name)) in enumerate(zip(dlls, layout)):
+        struct.pack_into('<IIIII', idata, n * 20, idata_rva + ilt, 0, 0, idata_rva + dll_name, idata_rva + iat)
+        for k, (function, name) in enumerate(zip(functions, names)):
+            struct.pack_into('<Q', idata, ilt + k * 8, idata_rva + name)
+            struct.pack_into('<Q', idata, iat + k * 8, idata_rva + name)
+            idata[name + 2:name + 2 + len(function)] = function.encode()
+        idata[dll_name:dll_name + len(dll)] = dll.encode()
+    idata = bytes(idata) + bytes(align(len(idata), file_align) - len(idata))
+    size_of_image = idata_rva + align(len(idata), section_align)
+
+    directories = [(0, 0)] * 16
+    directories[1] = (idata_rva, (len(dlls) + 1) * 20)
+    optional = struct.pack('<HBBIIIIIQIIHHHHHHIIIIHHQQQQII',
+                           0x20b, 14, 0, len(text), len(idata), 0, 0, text_rva,
+                           0x180000000, section_align, file_align, 6, 0, 0, 0, 6, 0,
+                           0, size_of_image, headers_size, 0, 2, 0x160,
+                           0x100000, 0x1000, 0x100000, 0x1000, 0, 16)
+    optional += b''.join(struct.pack('<II', *d) for d in directories)
+    sections = struct.pack('<8sIIIIIIHHI', b'.text', len(text), text_rva, len(text), headers_size, 0, 0, 0, 0, 0x60000020)
+    sections += struct.pack('<8sIIIIIIHHI', b'.idata', len(idata), idata_rva, len(idata), headers_size + len(text), 0, 0, 0, 0, 0xc0000040)
+    coff = struct.pack('<HHIIIHH', PE_MACHINES[arch], 2, 0, 0, 0, len(optional), 0x2022)
+
+    dos = bytearray(0x40)
+    dos[0:2] = b'MZ'
+    struct.pack_into('<I', dos, 0x3c, 0x40)
+    header = bytes(dos) + b'PE\0\0' + coff + optional + sections
+    return header + bytes(headers_size - len(header)) + text + idata
+
+def make_zip(files):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, data in files:
+            info = zipfile.ZipInfo(name, (2026, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, data)
+    return out.getvalue()
+
+#
+# Maven repository layout
+#
+
+LINUX_NEEDED = ['libwpiHal.so', 'libwpiutil.so', 'libm.so.6', 'libc.so.6']
+WINDOWS_IMPORTS = {
+    'KERNEL32.dll': ['GetLastError', 'CreateFileW', 'CloseHandle'],
+    'wpiHal.dll': ['HAL_Initialize'],
+    'wpiutil.dll': ['WPI_Now'],
+    'MSVCP140.dll': ['?_Xlength_error@std@@YAXPEBD@Z'],
+    'VCRUNTIME140.dll': ['memcpy', 'memset'],
+}
+
+class MavenRepo:
+    """Writes artifacts in the layout MavenFetcher expects, with .sha1 files"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.bytes = 0
+
+    def put(self, group, artifact, version, classifier, ext, data):
+        fn = '{0}-{1}{2}.{3}'.format(artifact, version, '-' + classifier if classifier else '', ext)
+        path = os.path.join(self.directory, group.replace('.', '/'), artifact, version, fn)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.sha1', 'w') as f:
+            f.write(hashlib.sha1(data).hexdigest())
+        self.bytes += len(data)
+
+def library_zip(rng, platform, build, lib_name, lib_size, symbols):
+    """The zip of one C++ binary platform/build, as published by vendors"""
+    if platform.startswith('linux'):
+        os_name, arch = 'linux', platform[5:]
+    elif platform.startswith('windows'):
+        os_name, arch = 'windows', platform[7:]
+    else:
+        os_name, arch = 'osx', platform[3:]
+    # check.py looks for debug builds under the release library name
+    name = lib_name
+    size = lib_size * (3 if build.endswith('debug') else 1)
+    if build.startswith('static'):
+        ext = '.lib' if os_name == 'windows' else '.a'
+        prefix = '' if os_name == 'windows' else 'lib'
+        return make_zip([('{0}/{1}/static/{2}{3}{4}'.format(os_name, arch, prefix, name, ext), b'!<arch>\n' + filler(rng, size))])
+    if os_name == 'linux':
+        lib = make_elf(rng, arch, size, LINUX_NEEDED, symbols)
+        return make_zip([('linux/{0}/shared/lib{1}.so'.format(arch, name), lib),
+                         ('linux/{0}/shared/lib{1}.so.debug'.format(arch, name), filler(rng, size // 2))])
+    if os_name == 'windows':
+        return make_zip([('windows/{0}/shared/{1}.dll'.format(arch, name), make_pe(rng, arch, size, WINDOWS_IMPORTS)),
+                         ('windows/{0}/shared/{1}.pdb'.format(arch, name), filler(rng, size))])
+    return make_zip([('osx/{0}/shared/lib{1}.dylib'.format(arch, name), filler(rng, size))])
+
+class Library:
+    """One synthetic vendor library: a C++ dependency (and optionally a Java
+    and JNI dependency) published to a maven repo"""
+    def __init__(self, name, version, platforms, lib_size, static=False, java=True, jni=False):
+        self.name = name
+        self.version = version
+        self.platforms = platforms
+        self.lib_size = lib_size
+        self.static = static
+        self.java = java
+        self.jni = jni
+        self.group = 'com.example.' + name.lower()
+
+    def builds(self):
+        return ['', 'debug', 'static', 'staticdebug'] if self.static else ['', 'debug']
+
+    def publish(self, repo, seed):
+        rng = random.Random('{0}-{1}-{2}'.format(seed, self.name, self.version))
+        symbols = ['_ZN6{0}{1}4implEi{2}'.format(len(self.name), self.name, n) for n in range(2000)]
+        artifact = self.name + '-cpp'
+        repo.put(self.group, artifact, self.version, 'headers', 'zip',
+                 make_zip([('{0}/h{1}.h'.format(self.name, n), filler(rng, 4000)) for n in range(200)]))
+        repo.put(self.group, artifact, self.version, 'sources', 'zip',
+                 make_zip([('{0}/s{1}.cpp'.format(self.name, n), filler(rng, 8000)) for n in range(100)]))
+        for platform in self.platforms:
+            for build in self.builds():
+                repo.put(self.group, artifact, self.version, platform + build, 'zip',
+                         library_zip(rng, platform, build, self.name, self.lib_size, symbols))
+        if self.jni:
+            for platform in self.platforms:
+                repo.put(self.group, self.name + '-jni', self.version, platform, 'zip',
+                         library_zip(rng, platform, '', self.name + 'jni', self.lib_size // 2, symbols[:200]))
+        if self.java:
+            for classifier in [None, 'sources', 'javadoc']:
+                repo.put(self.group, self.name + '-java', self.version, classifier, 'jar',
+                         make_zip([('A{0}.class'.format(n), filler(rng, 2000)) for n in range(100)]))
+
+    def dependencies(self):
+        java = [{'groupId': self.group, 'artifactId': self.name + '-java', 'version': self.version}] if self.java else []
+        jni = [{'groupId': self.group, 'artifactId': self.name + '-jni', 'version': self.version, 'isJar': False,
+                'validPlatforms': self.platforms, 'skipInvalidPlatforms': True}] if self.jni else []
+        cpp = [{'groupId': self.group, 'artifactId': self.name + '-cpp', 'version': self.version, 'libName': self.name,
+                'headerClassifier': 'headers', 'sourcesClassifier': 'sources', 'sharedLibrary': True,
+                'skipInvalidPlatforms': True, 'binaryPlatforms': self.platforms}]
+        return java, jni, cpp
+
+def vendordep(name, version, uuid, maven_urls, json_url, libraries):
+    j = {
+        'fileName': '{0}-{1}.json'.format(name, version),
+        'name': name,
+        'version': version,
+        'frcYear': '2026',
+        'uuid': uuid,
+        'mavenUrls': maven_urls,
+        'jsonUrl': json_url,
+        'javaDependencies': [],
+        'jniDependencies': [],
+        'cppDependencies': [],
+    }
+    for library in libraries:
+        java, jni, cpp = library.dependencies()
+        j['javaDependencies'] += java
+        j['jniDependencies'] += jni
+        j['cppDependencies'] += cpp
+    return json.dumps(j, indent=2)
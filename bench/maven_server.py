@@ -0,0 +1,177 @@
+"""
+A local stand-in for a vendor maven server.
+
+Serves a directory over HTTP/1.1 with keep-alive, HEAD and range requests,
+the features check.py relies on, and can be made to behave like a remote
+host: every request waits for a fixed latency, responses are sent at a
+limited bandwidth, and a deterministic fraction of the artifacts under a
+given path prefix answer 404 as a mirror that is missing files would.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class Stats:
+    """Connections, requests and bytes served, safe to update from handler threads"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.not_found = 0
+            self.bytes = 0
+            self.methods = {}
+
+    def add_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def add(self, method, status, nbytes):
+        with self.lock:
+            self.requests += 1
+            self.not_found += status == 404
+            self.bytes += nbytes
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'connections': self.connections, 'requests': self.requests, 'not_found': self.not_found,
+                    'bytes': self.bytes, 'methods': dict(self.methods)}
+
+class MavenServer(ThreadingHTTPServer):
+    """Serves root at http://127.0.0.1:port/.
+
+    latency is in seconds per request and bandwidth in bytes per second per
+    connection (0 for unlimited).  Paths under missing_prefix answer 404 with
+    probability missing_rate, decided by a hash of the seed and the artifact
+    path so that a file and its .sha1 are missing together and every run
+    sees the same files missing.
+    """
+    daemon_threads = True
+
+    def __init__(self, root, port=0, latency=0.0, bandwidth=0, missing_prefix='/mirror/', missing_rate=0.0, seed=0):
+        super().__init__(('127.0.0.1', port), MavenRequestHandler)
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.missing_prefix = missing_prefix
+        self.missing_rate = missing_rate
+        self.seed = seed
+        self.stats = Stats()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/'.format(self.server_address[1])
+
+    def is_missing(self, path):
+        if not self.missing_rate or not path.startswith(self.missing_prefix):
+            return False
+        if path.endswith('.sha1'):
+            path = path[:-5]
+        digest = hashlib.sha256('{0}:{1}'.format(self.seed, path).encode()).digest()
+        return int.from_bytes(digest[:8], 'big') < self.missing_rate * 2 ** 64
+
+    def translate(self, path):
+        """Maps a request path to a file, or None.  /mirror/ serves the same
+        repository as / so one directory can stand in for both."""
+        if path.startswith(self.missing_prefix):
+            path = '/' + path[len(self.missing_prefix):]
+        parts = [p for p in path.split('?')[0].split('/') if p]
+        if any(p in ('.', '..') for p in parts):
+            return None
+        fn = os.path.join(self.root, *parts)
+        return fn if os.path.isfile(fn) else None
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+def parse_range(header, size):
+    """Returns (start, end) for a single-range Range header, end exclusive,
+    or None if the header should be ignored."""
+    if not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].partition('-')
+    try:
+        if not first:
+            return max(size - int(last), 0), size
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= size:
+        return None
+    return start, min(end, size)
+
+class MavenRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.stats.add_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        fn = None if server.is_missing(self.path) else server.translate(self.path)
+        if fn is None:
+            body = b'Not Found'
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+            server.stats.add(self.command, 404, len(body) if send_body else 0)
+            return
+
+        with open(fn, 'rb') as f:
+            data = f.read()
+        size = len(data)
+        span = parse_range(self.headers.get('Range', ''), size)
+        if span is not None:
+            start, end = span
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end - 1, size))
+            data = data[start:end]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if send_body:
+            self.send_throttled(data)
+        server.stats.add(self.command, 200, len(data) if send_body else 0)
+
+    def send_throttled(self, data):
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            self.wfile.write(data)
+            return
+        # send in slices of ~10ms worth of bandwidth, sleeping to keep pace
+        chunk = max(bandwidth // 100, 1024)
+        started = time.monotonic()
+        for offset in range(0, len(data), chunk):
+            self.wfile.write(data[offset:offset + chunk])
+            ahead = started + (offset + chunk) / bandwidth - time.monotonic()
+            if ahead > 0:
+                time.sleep(ahead)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks check.py against a local stand-in maven server.
+
+Generates a synthetic maven repository of vendor libraries (once per set of
+generation parameters), serves it with bench/maven_server.py at a chosen
+latency, bandwidth and mirror 404 rate, and runs check.py over each
+scenario's vendordeps in a fresh process.  For every run it records the
+wall-clock time, the CPU time and peak RSS of the check.py process, and the
+connections, requests and bytes the server handled.
+
+Usage: run_bench.py [--scale N] [--latency MS] [--bandwidth SIZE]
+                    [--missing_rate R] [--repeat N] [--scenario NAME ...]
+                    [--output FILE] [-- check.py options]
+
+Everything is derived from --seed, so two runs with the same options check
+byte-identical artifacts and get the same 404s.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from artifacts import Library, MavenRepo, vendordep
+from check import parse_size
+from maven_server import MavenServer
+
+# bump when the generated artifacts change, so cached workdirs are rebuilt
+GENERATOR_VERSION = 1
+
+ROBOT_PLATFORMS = ['linuxathena', 'linuxarm32', 'linuxarm64', 'linuxx86-64', 'windowsx86-64', 'osxuniversal']
+
+def libraries(scale):
+    """The vendor libraries in the synthetic repository; lib_size is the
+    size of each release shared library in bytes"""
+    k = 1 << 10
+    return {
+        'small': Library('Blinky', '1.0.0', ['linuxathena', 'linuxx86-64', 'windowsx86-64'], int(200 * k * scale)),
+        'phoenix': Library('Phoenix', '26.1.0', ROBOT_PLATFORMS, int(2048 * k * scale), static=True, jni=True),
+        'tools': Library('PhoenixTools', '26.1.0', ROBOT_PLATFORMS, int(1024 * k * scale), java=False, jni=True),
+        'sim': Library('PhoenixSim', '26.1.0', ['linuxx86-64', 'windowsx86-64', 'osxuniversal'], int(4096 * k * scale), java=False),
+    }
+
+# scenario name -> the vendordeps to check, each (file name, library keys)
+SCENARIOS = {
+    # one small library, a handful of platforms
+    'small': [('Blinky.json', ['small'])],
+    # a large multi-library vendordep with JNI and static builds
+    'large': [('Phoenix.json', ['phoenix', 'tools', 'sim'])],
+    # two vendordeps sharing most artifacts, as a replacement and a beta of
+    # the same library do; the second should mostly be served from memory
+    'shared': [('Phoenix.json', ['phoenix', 'tools', 'sim']), ('PhoenixBeta.json', ['phoenix', 'tools'])],
+}
+
+def prepare(workdir, scale, seed):
+    """Generates the maven repository in workdir unless it is already there
+    with the same parameters.  Returns the number of artifact bytes."""
+    params = {'generator': GENERATOR_VERSION, 'scale': scale, 'seed': seed}
+    params_file = os.path.join(workdir, 'params.json')
+    try:
+        with open(params_file) as f:
+            existing = json.load(f)
+        if existing['params'] == params:
+            return existing['bytes']
+    except (IOError, ValueError, KeyError):
+        pass
+
+    print('generating artifacts in {0}'.format(workdir), file=sys.stderr)
+    shutil.rmtree(os.path.join(workdir, 'maven'), ignore_errors=True)
+    repo = MavenRepo(os.path.join(workdir, 'maven'))
+    for library in libraries(scale).values():
+        library.publish(repo, seed)
+    with open(params_file, 'w') as f:
+        json.dump({'params': params, 'bytes': repo.bytes}, f)
+    return repo.bytes
+
+def write_vendordeps(workdir, scale, scenario, base_url):
+    """Writes the scenario's vendordeps, which name the server's port, and
+    returns their paths.  They are in a 2026 directory like a bundle."""
+    libs = libraries(scale)
+    bundle = os.path.join(workdir, 'scenarios', scenario, '2026')
+    os.makedirs(bundle, exist_ok=True)
+    files = []
+    for n, (fn, keys) in enumerate(SCENARIOS[scenario]):
+        name = fn[:-len('.json')]
+        path = os.path.join(bundle, fn)
+        contents = vendordep(name, '26.1.0', '00000000-0000-4000-8000-{0:012d}'.format(n),
+                             [base_url + 'maven/', base_url + 'mirror/maven/'],
+                             base_url + 'scenarios/{0}/2026/{1}'.format(scenario, fn),
+                             [libs[key] for key in keys])
+        with open(path, 'w') as f:
+            f.write(contents)
+        files.append(path)
+    return files
+
+def run_check(files, check_args):
+    """Runs check.py over files in a child process.  Returns (status, wall
+    seconds, CPU seconds, peak RSS bytes, output)."""
+    env = dict(os.environ, NO_PROXY='127.0.0.1', no_proxy='127.0.0.1')
+    with tempfile.TemporaryFile() as out:
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(HERE), 'check.py')] + check_args + files,
+                                stdout=out, stderr=subprocess.STDOUT, env=env)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - started
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        output = out.read().decode('utf-8', 'replace')
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return proc.returncode, wall, usage.ru_utime + usage.ru_stime, rss, output
+
+def run_scenario(server, workdir, scale, scenario, check_args, repeat, cache_directory):
+    files = write_vendordeps(workdir, scale, scenario, server.url)
+    runs = []
+    for n in range(repeat):
+        args = list(check_args)
+        if cache_directory is not None:
+            # every run starts cold unless the cache is the thing measured
+            cache = os.path.join(cache_directory, '{0}-{1}'.format(scenario, n))
+            shutil.rmtree(cache, ignore_errors=True)
+            args = ['--cache_directory', cache] + args
+        server.stats.reset()
+        status, wall, cpu, rss, output = run_check(files, args)
+        stats = server.stats.snapshot()
+        runs.append({'status': status, 'wall': wall, 'cpu': cpu, 'max_rss': rss,
+                     'connections': stats['connections'], 'requests': stats['requests'], 'not_found': stats['not_found'],
+                     'bytes': stats['bytes'], 'methods': stats['methods']})
+        if status != 0:
+            print('{0}: check.py exited with {1}:\n{2}'.format(scenario, status, output), file=sys.stderr)
+    return {'files': [os.path.relpath(fn, workdir) for fn in files], 'runs': runs}
+
+def median(runs, key):
+    return statistics.median(run[key] for run in runs)
+
+def print_table(results):
+    print('{0:<10} {1:>8} {2:>8} {3:>9} {4:>6} {5:>9} {6:>10} {7:>6}'.format(
+        'scenario', 'wall s', 'cpu s', 'rss MiB', 'conns', 'requests', 'MiB sent', '404s'))
+    for scenario, result in results.items():
+        runs = result['runs']
+        print('{0:<10} {1:>8.3f} {2:>8.3f} {3:>9.1f} {4:>6.0f} {5:>9.0f} {6:>10.2f} {7:>6.0f}'.format(
+            scenario, median(runs, 'wall'), median(runs, 'cpu'), median(runs, 'max_rss') / (1 << 20),
+            median(runs, 'connections'), median(runs, 'requests'), median(runs, 'bytes') / (1 << 20), median(runs, 'not_found')))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks check.py against a local maven server',
+                                     epilog='Arguments after -- are passed to check.py.')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'vendordep-bench'),
+                        help='directory for the generated repository, reused while the generation options are unchanged')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for the size of every generated library (default 1)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the generated artifacts and the 404s (default 0)')
+    parser.add_argument('--latency', type=float, default=20, help='milliseconds the server waits before each response (default 20)')
+    parser.add_argument('--bandwidth', type=parse_size, default=0, help='bytes per second per connection, e.g. 10M (default unlimited)')
+    parser.add_argument('--missing_rate', type=float, default=0.1, help='fraction of artifacts missing from the mirror (default 0.1)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each scenario; the table shows medians (default 3)')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='scenario to run; may be repeated (default all)')
+    parser.add_argument('--cache', action='store_true', help='give each run its own fresh --cache_directory')
+    parser.add_argument('--output', help='write every run as JSON to this file')
+    args, check_args = parser.parse_known_args()
+    if check_args[:1] == ['--']:
+        check_args = check_args[1:]
+
+    os.makedirs(args.workdir, exist_ok=True)
+    repo_bytes = prepare(args.workdir, args.scale, args.seed)
+
+    server = MavenServer(args.workdir, latency=args.latency / 1000, bandwidth=args.bandwidth,
+                         missing_rate=args.missing_rate, seed=args.seed)
+    server.start()
+    results = {}
+    try:
+        for scenario in args.scenario or list(SCENARIOS):
+            results[scenario] = run_scenario(server, args.workdir, args.scale, scenario, check_args, args.repeat,
+                                             os.path.join(args.workdir, 'cache') if args.cache else None)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'options': {'scale': args.scale, 'seed': args.seed, 'latency_ms': args.latency, 'bandwidth': args.bandwidth,
+                            'missing_rate': args.missing_rate, 'cache': args.cache, 'check_args': check_args},
+                'repository_bytes': repo_bytes,
+                'scenarios': results,
+            }, f, indent=2)
+            f.write('\n')
+    if any(run['status'] != 0 for result in results.values() for run in result['runs']):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,65 @@
 #!/usr/bin/env python3
 
 import argparse
+import collections
+import concurrent.futures
 import configparser
-import http
+import contextlib
+import errno
+import hashlib
 import io
 import json
+import mmap
 import os
+import random
 import sys
-import urllib.request
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
 import uuid
 import pathlib
-from zipfile import ZipFile, BadZipFile
-
-try:
-    from elftools.elf.elffile import ELFFile
-    from elftools.elf.constants import E_FLAGS, E_FLAGS_MASKS
-    from elftools.elf.dynamic import DynamicSection
-    from elftools.elf.sections import SymbolTableSection
-except ImportError:
-    print('elftools not found, run pip3 install pyelftools', file=sys.stderr)
-    sys.exit(1)
-
-try:
-    import pefile
-except ImportError:
-    print('pefile not found, run pip3 install pefile', file=sys.stderr)
-    sys.exit(1)
+import re
+import shutil
+import struct
+import zlib
+from zipfile import ZipFile, BadZipFile, ZIP_STORED
+
+# The checker is started for every file by the Bazel tests and hooks, and
+# many runs never inspect a library or talk to a server, so the binary
+# inspection backends (pyelftools, pefile) and the HTTP stack (http.client,
+# ssl, urllib.request) are only imported when first needed.
+
+def load_elftools():
+    try:
+        import elftools.elf.elffile
+        import elftools.elf.dynamic
+        import elftools.elf.sections
+    except ImportError:
+        print('elftools not found, run pip3 install pyelftools', file=sys.stderr)
+        sys.exit(1)
+    return elftools.elf
+
+def load_pefile():
+    try:
+        import pefile
+    except ImportError:
+        print('pefile not found, run pip3 install pefile', file=sys.stderr)
+        sys.exit(1)
+    return pefile
 
 # Some webservers are set up to block urllib user agent, so override
-urlopener = urllib.request.build_opener()
-urlopener.addheaders = [('User-agent', 'Mozilla/5.0')]
+request_headers = [('User-agent', 'Mozilla/5.0')]
+urlopener = None
+
+def get_urlopener():
+    global urlopener
+    if urlopener is None:
+        import urllib.request
+        urlopener = urllib.request.build_opener()
+        urlopener.addheaders = request_headers
+    return urlopener
 
 #
 # Message reporting
@@ -41,9 +71,15 @@ got_warn = 0
 message_context = []
 cache_directory = None
 
+# (context depth, message list) pairs that msg() also records to; see
+# record_messages()
+message_recorders = []
+
 def msg(t, s):
     ctx = ': '.join(message_context) + ': ' if message_context else ''
     print('{0}: {1}{2}{3}'.format(json_filename, t, ctx, s), file=sys.stderr)
+    for depth, messages in message_recorders:
+        messages.append((t, message_context[depth:], s))
 
 def error(s):
     msg('ERROR: ', s)
@@ -58,29 +94,297 @@ def warn(s):
 def info(s):
     msg('INFO: ', s)
 
+@contextlib.contextmanager
+def record_messages():
+    """Record the messages reported inside the block as (type, context, text),
+    with the context relative to the current message context."""
+    messages = []
+    message_recorders.append((len(message_context), messages))
+    try:
+        yield messages
+    finally:
+        message_recorders.pop()
+
+def replay_messages(messages):
+    """Report messages recorded by record_messages() again, under the current
+    message context."""
+    report = {'ERROR: ': error, 'WARNING: ': warn, 'INFO: ': info}
+    for t, ctx, s in messages:
+        message_context.extend(ctx)
+        report[t](s)
+        del message_context[len(message_context) - len(ctx):]
+
+class Report:
+    """Messages and error/warning counts produced by checking a single file"""
+    def __init__(self, filename):
+        self.filename = filename
+        self.errors = 0
+        self.warnings = 0
+        self.output = []
+        self.seconds = None
+        self.budget = None
+        self.profile = None
+
+    def write(self, stream, text):
+        self.output.append((stream, text))
+
+    def replay(self):
+        """Write the captured output to the real stdout/stderr, in order."""
+        for stream, text in self.output:
+            getattr(sys, stream).write(text)
+
+    def summary(self):
+        summary = '{0}: {1} errors, {2} warnings'.format(self.filename, self.errors, self.warnings)
+        if self.budget:
+            summary += ', {0:.1f}s of {1:g}s time budget'.format(self.seconds, self.budget)
+        return summary
+
+class ReportWriter:
+    """File-like object that captures one stream's output into a Report"""
+    def __init__(self, report, stream):
+        self.report = report
+        self.stream = stream
+
+    def write(self, text):
+        self.report.write(self.stream, text)
+        return len(text)
+
+    def flush(self):
+        pass
+
 #
 # Global configuration
 #
 
 verbose = 0
 local_maven = None
+processes = 1
+jobs = 8
+jobs_per_host = 4
+full_downloads = False
+no_result_cache = False
+lint = False
+memo_max_size = 1 << 30
+cache_max_size = 10 << 30
+cache_negative_ttl = 3600
+listed_mirror_order = False
+connect_timeout = 10.0
+read_timeout = 30.0
+min_throughput = 1 << 10
+stall_window = 10.0
+retries = 3
+file_time_budget = 0
+spool_size = 8 << 20
+profile_file = None
+profile_top = 0
+changed_since = None
+changed_scope = None
+serve = False
+client = False
+serve_port = 8734
+poll_interval = 0.5
+
+def parse_size(s):
+    """Parse a byte count with an optional K/M/G/T suffix"""
+    units = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+    s = s.strip().lower().rstrip('b')
+    try:
+        if s and s[-1] in units:
+            return int(float(s[:-1]) * units[s[-1]])
+        return int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid size "{0}"'.format(s))
 
 def parse_args(argv):
     """Parse command line arguments.  Returns list of filenames."""
     parser = argparse.ArgumentParser(description='Checks a vendor json file')
     parser.add_argument('--verbose', '-v', action='count', help='increase the verbosity of output')
+    parser.add_argument('--lint', action='store_true', help='only run the checks that need no network access; with no files, checks every bundle directory')
+    parser.add_argument('--changed_since', metavar='REV', help='only check the artifacts of files added or modified since git revision REV that no unchanged file already lists; other files get the offline checks.  If check.py or any .ini or .cfg file changed, every file given is checked in full.  With no files, checks every bundle directory')
     parser.add_argument('--local-maven', help='directory to use for artifacts instead of fetching from mavenUrls')
-    parser.add_argument('--cache_directory', type=pathlib.Path, help='Optional. If present will set up a download cache in this directory to prevent re-downloading artifacts. Should be used for debugging purposes only.')
-    parser.add_argument('file', nargs='+', help='json file to parse')
+    parser.add_argument('--cache_directory', type=pathlib.Path, help='Optional. If present will set up a download cache in this directory to prevent re-downloading artifacts. The directory can be shared by concurrent runs.')
+    parser.add_argument('--cache_max_size', type=parse_size, default=10 << 30, help='size limit of the download cache, e.g. 500M or 10G (default 10G); least recently used artifacts are evicted first')
+    parser.add_argument('--cache_negative_ttl', type=float, default=3600, help='seconds to remember that an artifact is missing from every maven repo (default 3600, 0 disables)')
+    parser.add_argument('--full-downloads', action='store_true', help='download every artifact from every maven repo, even where only its existence is checked')
+    parser.add_argument('--no_result_cache', action='store_true', help='do not use or update the check results stored in the cache directory')
+    parser.add_argument('--memo_max_size', type=parse_size, default=1 << 30, help='memory to use for keeping downloaded artifacts that more than one file may check (default 1G, 0 disables)')
+    parser.add_argument('--processes', '-P', type=int, default=1, help='number of files to check in parallel worker processes (default 1, 0 uses one per CPU)')
+    parser.add_argument('--jobs', '-j', type=int, default=8, help='number of artifacts to download concurrently (default 8, 1 disables concurrent downloads)')
+    parser.add_argument('--jobs-per-host', type=int, default=4, help='maximum number of concurrent downloads from a single host (default 4)')
+    parser.add_argument('--connect_timeout', type=float, default=10, help='seconds to wait for a connection to a server (default 10)')
+    parser.add_argument('--read_timeout', type=float, default=30, help='seconds to wait for a server to send anything (default 30)')
+    parser.add_argument('--min_throughput', type=parse_size, default=1 << 10, help='abandon downloads that receive less than this many bytes per second over --stall_window seconds (default 1K, 0 disables)')
+    parser.add_argument('--stall_window', type=float, default=10, help='seconds over which --min_throughput is measured (default 10)')
+    parser.add_argument('--retries', type=int, default=3, help='times to retry a request after a connection failure, timeout, stall or 429/5xx response (default 3)')
+    parser.add_argument('--file_time_budget', type=float, default=0, help='seconds each file may spend on network requests; the rest fail once it is used up (default 0, unlimited)')
+    parser.add_argument('--spool_size', type=parse_size, default=8 << 20, help='artifacts and libraries larger than this are kept in memory mapped temporary files instead of memory (default 8M)')
+    parser.add_argument('--listed_mirror_order', action='store_true', help='try the mavenUrls in the order listed instead of fastest first')
+    parser.add_argument('--profile', help='write the time and bytes transferred for each phase of checking each artifact to this JSON file')
+    parser.add_argument('--profile_top', type=int, default=0, help='print the N slowest artifacts after checking')
+    parser.add_argument('--serve', action='store_true', help='run as a daemon that keeps its caches warm, watches the files (with none, every bundle directory) and rechecks the ones that change; see --client')
+    parser.add_argument('--client', action='store_true', help='have the --serve daemon check the files, or with none, print its rechecks as they happen')
+    parser.add_argument('--port', type=int, default=8734, help='local TCP port for --serve and --client (default 8734)')
+    parser.add_argument('--poll_interval', type=float, default=0.5, help='seconds between checks of the watched files for changes with --serve (default 0.5)')
+    parser.add_argument('file', nargs='*', help='json file to parse')
     args = parser.parse_args(argv)
+    if not args.file and not args.lint and args.changed_since is None and not args.serve and not args.client:
+        parser.error('the following arguments are required: file')
 
-    global verbose, local_maven, cache_directory
+    global verbose, lint, local_maven, full_downloads, no_result_cache, memo_max_size, cache_directory, cache_max_size, cache_negative_ttl, processes, jobs, jobs_per_host, connect_timeout, read_timeout, min_throughput, stall_window, retries, file_time_budget, spool_size, listed_mirror_order, profile_file, profile_top, changed_since, changed_scope, serve, client, serve_port, poll_interval
     verbose = args.verbose or 0
+    lint = args.lint
     local_maven = args.local_maven
+    full_downloads = args.full_downloads
+    no_result_cache = args.no_result_cache
+    memo_max_size = args.memo_max_size
     cache_directory = args.cache_directory
+    cache_max_size = args.cache_max_size
+    cache_negative_ttl = args.cache_negative_ttl
+    processes = args.processes if args.processes > 0 else os.cpu_count() or 1
+    jobs = max(args.jobs, 1)
+    jobs_per_host = max(args.jobs_per_host, 1)
+    connect_timeout = args.connect_timeout
+    read_timeout = args.read_timeout
+    min_throughput = args.min_throughput
+    stall_window = args.stall_window
+    retries = max(args.retries, 0)
+    file_time_budget = args.file_time_budget
+    spool_size = args.spool_size
+    listed_mirror_order = args.listed_mirror_order
+    profile_file = args.profile
+    profile_top = args.profile_top
+    changed_since = args.changed_since
+    changed_scope = args.file
+    serve = args.serve
+    client = args.client
+    serve_port = args.port
+    poll_interval = args.poll_interval
+    if changed_since is not None:
+        try:
+            get_change_set()
+        except ValueError as e:
+            parser.error(str(e))
 
+    if not args.file:
+        return [] if serve or client else bundle_files()
     return args.file
 
+def bundle_files():
+    """Returns every vendordep file in every bundle directory.  A bundle
+    directory is one with a YEAR_metadata.json file next to it."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    files = []
+    for metadata in sorted(pathlib.Path(root).glob('*_metadata.json')):
+        bundle = metadata.with_name(metadata.name[:-len('_metadata.json')])
+        files.extend(os.path.relpath(fn) for fn in sorted(bundle.glob('*.json')))
+    return files
+
+#
+# Profiling
+#
+
+# bytes received over HTTP by each thread; see transferred()
+transfer_counter = threading.local()
+
+def count_transfer(n):
+    transfer_counter.bytes = getattr(transfer_counter, 'bytes', 0) + n
+
+def transferred():
+    """Bytes received over HTTP by the current thread so far"""
+    return getattr(transfer_counter, 'bytes', 0)
+
+class ProfileFrame:
+    def __init__(self, phase, name):
+        self.phase = phase
+        self.name = name
+        self.start = time.perf_counter()
+        self.start_bytes = transferred()
+        # time and bytes of nested phases, which are not counted again here
+        self.child_seconds = 0.0
+        self.child_bytes = 0
+        # bytes transferred for this phase by other threads
+        self.extra_bytes = 0
+        self.download_seconds = None
+
+# The (context, phase, seconds, bytes) profile of the file being checked, or
+# None when not profiling
+profile_entries = None
+profile_stack = []
+
+@contextlib.contextmanager
+def profiled(phase, name=None):
+    """Record the time and bytes spent in the block as a phase of the check,
+    under the current message context plus name.  Time and bytes of nested
+    phases are only counted for the innermost one.  Yields a ProfileFrame;
+    its name can still be set inside the block."""
+    if profile_entries is None:
+        yield None
+        return
+    frame = ProfileFrame(phase, name)
+    context = list(message_context)
+    profile_stack.append(frame)
+    try:
+        yield frame
+    finally:
+        profile_stack.pop()
+        seconds = time.perf_counter() - frame.start
+        nbytes = transferred() - frame.start_bytes
+        if profile_stack:
+            profile_stack[-1].child_seconds += seconds
+            profile_stack[-1].child_bytes += nbytes
+        entry = {
+            'context': context + ([frame.name] if frame.name else []),
+            'phase': phase,
+            'seconds': seconds - frame.child_seconds,
+            'bytes': nbytes - frame.child_bytes + frame.extra_bytes,
+        }
+        if frame.download_seconds is not None:
+            entry['download_seconds'] = frame.download_seconds
+        profile_entries.append(entry)
+
+def profile_artifacts(reports):
+    """Totals of the profile entries of each artifact, slowest first.  An
+    artifact is a dependency's context plus the artifact file name, e.g.
+    cppDep.0: vendor-cpp-1.0-linuxathena.zip; its entries include the checks
+    of the libraries inside it."""
+    artifacts = {}
+    for report in reports:
+        for entry in report.profile or []:
+            if len(entry['context']) < 2:
+                continue
+            key = (report.filename,) + tuple(entry['context'][:2])
+            total = artifacts.setdefault(key, {'seconds': 0.0, 'bytes': 0, 'phases': {}})
+            total['seconds'] += entry['seconds']
+            total['bytes'] += entry['bytes']
+            total['phases'][entry['phase']] = total['phases'].get(entry['phase'], 0.0) + entry['seconds']
+    return sorted(artifacts.items(), key=lambda item: -item[1]['seconds'])
+
+def write_profile(fn, reports):
+    files = []
+    phases = {}
+    for report in reports:
+        totals = {}
+        for entry in report.profile or []:
+            total = totals.setdefault(entry['phase'], {'seconds': 0.0, 'bytes': 0})
+            total['seconds'] += entry['seconds']
+            total['bytes'] += entry['bytes']
+        for phase, total in totals.items():
+            overall = phases.setdefault(phase, {'seconds': 0.0, 'bytes': 0})
+            overall['seconds'] += total['seconds']
+            overall['bytes'] += total['bytes']
+        files.append({'file': report.filename, 'seconds': report.seconds, 'phases': totals, 'entries': report.profile or []})
+    artifacts = [{'file': key[0], 'context': list(key[1:]), 'seconds': total['seconds'], 'bytes': total['bytes'], 'phases': total['phases']}
+                 for key, total in profile_artifacts(reports)]
+    with open(fn, 'w') as f:
+        json.dump({'version': 1, 'jobs': jobs, 'processes': processes, 'phases': phases, 'files': files, 'artifacts': artifacts}, f, indent=1)
+        f.write('\n')
+
+def print_profile_summary(reports, count):
+    print('slowest artifacts:', file=sys.stderr)
+    for key, total in profile_artifacts(reports)[:count]:
+        phases = ', '.join('{0} {1:.3f}s'.format(phase, seconds) for phase, seconds in sorted(total['phases'].items(), key=lambda item: -item[1]))
+        print('  {0:8.3f}s {1:10.1f}K  {2}: {3} ({4})'.format(total['seconds'], total['bytes'] / 1024, key[0], ': '.join(key[1:]), phases), file=sys.stderr)
+
 #
 # Per-file configuration
 #
@@ -88,12 +392,22 @@ def parse_args(argv):
 class FileConfig:
     def __init__(self):
         self.parser = None
+        self.digest = None
 
     def load(self, json_fn):
         """Load configuration"""
         self.parser = configparser.ConfigParser(default_section='')
         basefn = os.path.splitext(json_fn)[0]
         self.parser.read([basefn + '.ini', basefn + '.cfg'])
+        digest = hashlib.sha256()
+        for fn in [basefn + '.ini', basefn + '.cfg']:
+            try:
+                with open(fn, 'rb') as f:
+                    digest.update(f.read())
+            except OSError:
+                pass
+            digest.update(b'\0')
+        self.digest = digest.hexdigest()
 
     def getboolean(self, option):
         try:
@@ -108,6 +422,96 @@ class FileConfig:
 
 file_config = FileConfig()
 
+#
+# Changed files
+#
+
+# the kinds of dependency lists in a vendordep, in check order
+DEPENDENCY_KINDS = ['javaDependencies', 'cppDependencies', 'jniDependencies']
+
+class ChangeSet:
+    """The vendordep files added or modified since a git revision.
+
+    Only those files get their artifacts checked; the rest have not changed
+    since the revision, so their artifacts were already checked then.  A
+    dependency of a changed file that an unchanged file also lists (with the
+    same maven repositories and year) was checked along with that file and
+    is skipped too, so a new version of a vendordep only pays for the
+    artifacts it adds.
+
+    A change to the checks themselves (check.py) or to any file's .ini or
+    .cfg settings can change what unchanged files report, so then every file
+    in scope (the files named on the command line, or with none, every
+    bundle file) counts as changed and is checked in full.
+    """
+    def __init__(self, rev, scope=None):
+        import subprocess
+        self.rev = rev
+        self.files = scope
+        self.scope = {os.path.realpath(fn) for fn in scope} if scope else None
+        self.root = os.path.dirname(os.path.realpath(__file__))
+        def git(*args):
+            try:
+                result = subprocess.run(['git'] + list(args), cwd=self.root, capture_output=True, text=True)
+            except OSError as e:
+                raise ValueError('could not run git: {0}'.format(e))
+            if result.returncode != 0:
+                raise ValueError('git {0} failed: {1}'.format(' '.join(args), result.stderr.strip()))
+            return result.stdout
+        top = git('rev-parse', '--show-toplevel').strip()
+        # every path that differs from rev, in either direction, and new
+        # files that are not yet added
+        names = git('diff', '--name-only', '--no-renames', '-z', rev, '--').split('\0')
+        names += git('ls-files', '--others', '--exclude-standard', '-z').split('\0')
+        self.changed = {os.path.realpath(os.path.join(top, name)) for name in names if name}
+        script = os.path.realpath(__file__)
+        self.full = any(fn == script or fn.endswith('.ini') or fn.endswith('.cfg') for fn in self.changed)
+
+        self.known = set()
+        if self.full:
+            return
+        for fn in bundle_files():
+            if self.is_changed(fn):
+                continue
+            try:
+                with open(fn, 'rb') as f:
+                    j = json.loads(f.read())
+                for kind, dep in self.dependencies(j):
+                    self.known.add(self.dependency_key(j, kind, dep))
+            except (OSError, ValueError, TypeError, AttributeError):
+                continue
+
+    def is_changed(self, fn):
+        fn = os.path.realpath(fn)
+        if fn in self.changed:
+            return True
+        return self.full and (self.scope is None or fn in self.scope)
+
+    @staticmethod
+    def dependencies(j):
+        for kind in DEPENDENCY_KINDS:
+            for dep in j.get(kind) or []:
+                yield kind, dep
+
+    @staticmethod
+    def dependency_key(j, kind, dep):
+        return (kind, json.dumps(dep, sort_keys=True), tuple(j.get('mavenUrls') or []),
+                j.get('wpilibYear') or j.get('frcYear'))
+
+    def is_known(self, j, kind, dep):
+        """Whether an unchanged file lists the same dependency"""
+        return self.dependency_key(j, kind, dep) in self.known
+
+change_set = None
+
+def get_change_set():
+    global change_set
+    if changed_since is None:
+        return None
+    if change_set is None or change_set.rev != changed_since or change_set.files != changed_scope:
+        change_set = ChangeSet(changed_since, changed_scope)
+    return change_set
+
 #
 # JSON schema checker
 #
@@ -189,81 +593,1678 @@ def check_schema(j, schema, key):
         if not j:
             error('"{0}" cannot be empty string'.format(key_str(key)))
 
+def compile_schema(schema):
+    """Compile a schema into a function validate(j, key) that reports the same
+    messages as check_schema(j, schema, key), but does not have to walk the
+    schema or compare type names for every value.  Values of the wrong type
+    are handed to check_schema."""
+    original = schema
+    if isinstance(schema, Optional):
+        schema = schema.inner
+    expected = type(schema)
+
+    if isinstance(schema, dict):
+        fields = {k: compile_schema(v) for k, v in schema.items()}
+        required = [k for k, v in schema.items() if not isinstance(v, Optional)]
+        def validate(j, key):
+            if type(j) is not dict:
+                return check_schema(j, original, key)
+            for k, v in j.items():
+                field = fields.get(k)
+                if field is None:
+                    warn('unexpected key "{0}"'.format(key_str(key + (k,))))
+                    continue
+                field(v, key + (k,))
+            for k in required:
+                if k not in j:
+                    error('missing key "{0}"'.format(key_str(key + (k,))))
+    elif isinstance(schema, list):
+        item = compile_schema(schema[0])
+        def validate(j, key):
+            if type(j) is not list:
+                return check_schema(j, original, key)
+            for n, e in enumerate(j):
+                item(e, key + (str(n),))
+    elif isinstance(schema, str):
+        def validate(j, key):
+            if type(j) is not str:
+                return check_schema(j, original, key)
+            if not j:
+                error('"{0}" cannot be empty string'.format(key_str(key)))
+    else:
+        def validate(j, key):
+            if type(j) is not expected:
+                return check_schema(j, original, key)
+    return validate
+
+validate_schema = compile_schema(json_schema)
+
+#
+# HTTP connections
+#
+
+class StallError(IOError):
+    """A download received less than --min_throughput"""
+
+class TimeBudgetExceeded(urllib.error.URLError):
+    def __init__(self):
+        super().__init__('time budget of {0:g}s for the file used up'.format(file_time_budget))
+
+# time.monotonic() by which the current file's requests must be done, or None
+file_deadline = None
+
+def remaining_time():
+    """Seconds left of the current file's time budget, or None if unlimited.
+    Raises TimeBudgetExceeded once it is used up."""
+    if file_deadline is None:
+        return None
+    remaining = file_deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeBudgetExceeded()
+    return remaining
+
+def request_timeout():
+    """The socket timeout for the next read: --read_timeout, but no later
+    than the file's deadline"""
+    remaining = remaining_time()
+    return read_timeout if remaining is None else min(read_timeout, remaining)
+
+class PooledResponse:
+    """HTTP response that returns its connection to the pool when closed.
+
+    Reading the whole body reads it in chunks, and gives up with StallError
+    if less than min_throughput bytes per second arrive over any
+    stall_window, or with TimeBudgetExceeded at the file's deadline.
+    """
+    chunk_size = 64 << 10
+
+    def __init__(self, pool, key, conn, response):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+
+    def read(self, n=-1):
+        if n is not None and n >= 0:
+            data = self.response.read(n)
+            count_transfer(len(data))
+            return data
+        chunks = []
+        self.stream(chunks.append)
+        return b''.join(chunks)
+
+    def stream(self, write):
+        """Pass the rest of the body to write() as it arrives"""
+        window_start = time.monotonic()
+        window_bytes = 0
+        while True:
+            # read1 returns whatever has arrived, so a slow server cannot
+            # hold a read past the checks below
+            chunk = self.response.read1(self.chunk_size)
+            if not chunk:
+                # read1() never marks the response as complete (nor does
+                # anything for a HEAD); read() does, so close() can return
+                # the connection to the pool
+                self.response.read()
+                break
+            count_transfer(len(chunk))
+            write(chunk)
+            window_bytes += len(chunk)
+            now = time.monotonic()
+            if min_throughput and now - window_start >= stall_window:
+                if window_bytes < min_throughput * (now - window_start):
+                    raise StallError('download stalled at {0:.0f} bytes/s'.format(window_bytes / (now - window_start)))
+                window_start = now
+                window_bytes = 0
+            if self.conn is not None and self.conn.sock is not None:
+                self.conn.sock.settimeout(request_timeout())
+
+    def close(self):
+        if self.conn is None:
+            return
+        # the connection can only be reused once the body has been consumed
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool.release(self.key, self.conn)
+        else:
+            self.response.close()
+            self.conn.close()
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ConnectionPool:
+    """Reuses HTTP/1.1 keep-alive connections to each host for the whole run.
+
+    open() is a drop-in replacement for urlopener.open(): redirects are
+    followed and error statuses raise urllib.error.HTTPError.  Requests that
+    have to go through a proxy are handed to urlopener instead.
+    """
+    max_redirects = 10
+
+    def __init__(self, headers):
+        self.headers = dict(headers)
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.ssl_context = None
+
+    def connect(self, key):
+        import http.client
+        scheme, netloc = key
+        if scheme == 'https':
+            if self.ssl_context is None:
+                import ssl
+                self.ssl_context = ssl.create_default_context()
+            return http.client.HTTPSConnection(netloc, timeout=connect_timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(netloc, timeout=connect_timeout)
+
+    def acquire(self, key):
+        """Returns (connection, reused)"""
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                return conns.pop(), True
+        return self.connect(key), False
+
+    def release(self, key, conn):
+        with self.lock:
+            self.idle.setdefault(key, []).append(conn)
+
+    def close(self):
+        with self.lock:
+            conns = [conn for conns in self.idle.values() for conn in conns]
+            self.idle.clear()
+        for conn in conns:
+            conn.close()
+
+    def request(self, method, url, headers=None):
+        """Send a single request and return (key, connection, response)"""
+        import http.client
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        allheaders = dict(self.headers)
+        if headers:
+            allheaders.update(headers)
+        host = '{0}://{1}'.format(*key)
+        while True:
+            conn, reused = self.acquire(key)
+            try:
+                start = time.perf_counter()
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(request_timeout())
+                conn.request(method, path, headers=allheaders)
+                response = conn.getresponse()
+            except TimeBudgetExceeded:
+                # our own budget ran out; that says nothing about the host
+                conn.close()
+                raise
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                conn.close()
+                # the server dropped an idle keep-alive connection; retry on
+                # a fresh one
+                if reused:
+                    continue
+                get_mirror_stats().record(host, ok=False)
+                raise urllib.error.URLError(e)
+            except OSError as e:
+                conn.close()
+                get_mirror_stats().record(host, ok=False)
+                raise urllib.error.URLError(e)
+            except BaseException:
+                conn.close()
+                raise
+            get_mirror_stats().record(host, time.perf_counter() - start, response.status < 500)
+            return key, conn, response
+
+    def open(self, url, method='GET', headers=None):
+        if url.split(':', 1)[0] not in ('http', 'https') or self.use_proxy(url):
+            from urllib.request import Request
+            return get_urlopener().open(Request(url, method=method, headers=headers or {}), timeout=request_timeout())
+        for _ in range(self.max_redirects + 1):
+            key, conn, response = self.request(method, url, headers)
+            f = PooledResponse(self, key, conn, response)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                f.read()
+                f.close()
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            if response.status >= 400:
+                body = f.read()
+                f.close()
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+            return f
+        raise urllib.error.HTTPError(url, response.status, 'too many redirects', response.headers, None)
+
+    @staticmethod
+    def use_proxy(url):
+        from urllib.request import getproxies, proxy_bypass
+        parts = urllib.parse.urlsplit(url)
+        return parts.scheme in getproxies() and not proxy_bypass(parts.hostname or '')
+
+http_pool = ConnectionPool(request_headers)
+
+#
+# Artifact cache
+#
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class ArtifactCache:
+    """On-disk artifact cache that can be shared by concurrent check runs.
+
+    Each artifact is stored at its maven path along with a .sha1 file holding
+    its checksum, which is verified on every read.  Entries are written to a
+    temporary file and renamed into place, so readers never see a partial
+    file.  Once the cache grows past max_size the least recently used
+    artifacts are evicted.  Artifacts that no maven repo has are remembered
+    in .missing files for negative_ttl seconds.
+    """
+    def __init__(self, directory, max_size, negative_ttl):
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.size = None
+
+    def entry_path(self, path):
+        return self.directory / path
+
+    def get(self, path):
+        """Returns the cached artifact, or None on a miss."""
+        entry = self.entry_path(path)
+        try:
+            data = entry.read_bytes()
+            expected = entry.with_name(entry.name + '.sha1').read_text().strip()
+        except OSError:
+            return None
+        if hashlib.sha1(data).hexdigest() != expected:
+            # corrupt or truncated; drop it and fetch again
+            self.remove(entry)
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return data
+
+    def open(self, path):
+        """Returns the cached artifact as a MappedFile, or None on a miss."""
+        entry = self.entry_path(path)
+        try:
+            expected = entry.with_name(entry.name + '.sha1').read_text().strip()
+            with open(entry, 'rb') as f:
+                mapped = map_file(f)
+        except OSError:
+            return None
+        if hashlib.sha1(mapped.view(0, mapped.size)).hexdigest() != expected:
+            self.remove(entry)
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return mapped
+
+    def put(self, path, data, sha1=None):
+        """Store an artifact.  Returns False if it does not match sha1."""
+        return self.put_file(path, io.BytesIO(data), sha1)
+
+    def put_file(self, path, f, sha1=None):
+        """Store an artifact from the file object f, copied from its start
+        in chunks.  Returns False if it does not match sha1."""
+        entry = self.entry_path(path)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix='.' + entry.name, suffix='.tmp')
+        digest = hashlib.sha1()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                f.seek(0)
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            if sha1 is not None and sha1 != digest.hexdigest():
+                self.remove(pathlib.Path(tmp))
+                return False
+            self.write(entry.with_name(entry.name + '.sha1'), digest.hexdigest().encode())
+            os.replace(tmp, entry)
+        except BaseException:
+            self.remove(pathlib.Path(tmp))
+            raise
+        self.remove(entry.with_name(entry.name + '.missing'))
+        self.account(size)
+        return True
+
+    def contains(self, path):
+        return self.entry_path(path).is_file()
+
+    def get_sha1(self, path):
+        entry = self.entry_path(path)
+        try:
+            return entry.with_name(entry.name + '.sha1').read_text().strip()
+        except OSError:
+            return None
+
+    def put_sha1(self, path, sha1):
+        entry = self.entry_path(path)
+        self.write(entry.with_name(entry.name + '.sha1'), sha1.encode())
+
+    def get_missing(self, path, urls):
+        """Returns the failure messages recorded for a missing artifact, or None."""
+        if self.negative_ttl <= 0:
+            return None
+        entry = self.entry_path(path)
+        entry = entry.with_name(entry.name + '.missing')
+        try:
+            if time.time() - entry.stat().st_mtime > self.negative_ttl:
+                return None
+            missing = json.loads(entry.read_bytes())
+        except (OSError, ValueError):
+            return None
+        if missing.get('urls') != urls:
+            return None
+        return missing.get('failures', [])
+
+    def put_missing(self, path, urls, failures):
+        if self.negative_ttl <= 0:
+            return
+        entry = self.entry_path(path)
+        self.write(entry.with_name(entry.name + '.missing'), json.dumps({'urls': urls, 'failures': failures}).encode())
+
+    @staticmethod
+    def write(entry, data):
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix='.' + entry.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, entry)
+        except BaseException:
+            ArtifactCache.remove(pathlib.Path(tmp))
+            raise
+
+    @staticmethod
+    def remove(entry):
+        try:
+            entry.unlink()
+        except OSError:
+            pass
+
+    def account(self, nbytes):
+        with self.lock:
+            if self.size is None:
+                self.size = self.scan()[0]
+            else:
+                self.size += nbytes
+            if self.size <= self.max_size:
+                return
+            self.evict()
+
+    def scan(self):
+        """Returns (total size, [(mtime, size, path)] of artifacts)
+
+        Only artifact entries count: dot-directories (the result cache) and
+        dot-files (the lock and mirror statistics) are neither counted nor
+        evicted.
+        """
+        total = 0
+        artifacts = []
+        now = time.time()
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for name in filenames:
+                if name.startswith('.') and not name.endswith('.tmp'):
+                    continue
+                entry = pathlib.Path(dirpath) / name
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if name.endswith('.tmp') or name.endswith('.missing'):
+                    # abandoned temporary files and expired negative entries
+                    if now - st.st_mtime > max(self.negative_ttl, 3600):
+                        self.remove(entry)
+                        continue
+                elif not name.endswith('.sha1'):
+                    artifacts.append((st.st_mtime, st.st_size, entry))
+                total += st.st_size
+        return total, artifacts
+
+    def evict(self):
+        """Remove least recently used artifacts until the cache is 90% full"""
+        with contextlib.ExitStack() as stack:
+            if fcntl is not None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                lockfile = stack.enter_context(open(self.directory / '.lock', 'a'))
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+            total, artifacts = self.scan()
+            target = self.max_size * 9 // 10
+            for mtime, size, entry in sorted(artifacts, key=lambda a: a[0]):
+                if total <= target:
+                    break
+                self.remove(entry)
+                self.remove(entry.with_name(entry.name + '.sha1'))
+                total -= size
+            self.size = total
+
+artifact_cache = None
+
+def get_artifact_cache():
+    """Returns the download cache, or None if caching is disabled."""
+    global artifact_cache
+    if not cache_directory:
+        return None
+    if artifact_cache is None or artifact_cache.directory != pathlib.Path(cache_directory):
+        artifact_cache = ArtifactCache(cache_directory, cache_max_size, cache_negative_ttl)
+    return artifact_cache
+
+#
+# Result cache
+#
+
+def check_logic_version():
+    """Digest of this script, so cached results are dropped whenever the checks
+    change.  None if it cannot be read."""
+    try:
+        with open(__file__, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (OSError, NameError):
+        return None
+
+class ResultCache:
+    """Persistent store of the messages reported by artifact-level checks.
+
+    Published maven artifacts never change, so checking the same artifact
+    (identified by its sha1) for the same vendordep JSON and .ini file with
+    the same version of the checks always reports the same messages, which
+    can be replayed without downloading or parsing anything.  Results that
+    include fetch failures can change as mirrors catch up, so those expire
+    after ttl seconds, like missing artifacts do.
+    """
+    def __init__(self, directory, version, ttl):
+        self.directory = pathlib.Path(directory) / '.results'
+        self.version = version
+        self.ttl = ttl
+
+    def key(self, *parts):
+        return hashlib.sha256(json.dumps([self.version] + list(parts)).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return self.directory / key[:2] / (key + '.json')
+
+    def get(self, key):
+        """Returns the recorded messages, or None if there is no result."""
+        entry = self.entry_path(key)
+        try:
+            result = json.loads(entry.read_bytes())
+            if result['expires'] and time.time() - entry.stat().st_mtime > self.ttl:
+                return None
+            return result['messages']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, messages, expires):
+        ArtifactCache.write(self.entry_path(key), json.dumps({'messages': messages, 'expires': expires}).encode())
+
+result_cache = None
+
+def get_result_cache():
+    """Returns the result cache, or None if it is disabled."""
+    global result_cache
+    if not cache_directory or no_result_cache:
+        return None
+    if result_cache is None or result_cache.directory.parent != pathlib.Path(cache_directory):
+        version = check_logic_version()
+        if version is None:
+            return None
+        result_cache = ResultCache(cache_directory, version, cache_negative_ttl)
+    return result_cache
+
+def run_cached(fetcher, classifier, check, *args):
+    """Run an artifact-level check of an artifact opened with fetcher, or
+    replay its messages from the result cache or from an identical check
+    earlier in this run."""
+    messages = fetcher.results.get(classifier)
+    if messages is not None:
+        with profiled('cached', fetcher.filename(classifier)):
+            replay_messages(messages)
+        return
+    memo = get_artifact_memo()
+    memo_key = (check.__name__, args, file_config.digest)
+    found = memo.get_result(fetcher.memo_key(classifier, 'open'), memo_key)
+    if found is not None:
+        messages, expires = found
+        with profiled('cached', fetcher.filename(classifier)):
+            replay_messages(messages)
+    else:
+        failures = fetcher.failures
+        transient = len(fetcher.transient)
+        with record_messages() as messages:
+            check(fetcher, *args)
+        expires = fetcher.failures != failures
+        if len(fetcher.transient) != transient:
+            # timeouts and connection failures say nothing about the artifact
+            return
+        memo.put_result(fetcher.memo_key(classifier, 'open'), memo_key, messages, expires)
+    key = fetcher.result_keys.get(classifier)
+    if key is not None:
+        get_result_cache().put(key, messages, expires)
+
+def lookup_cached_results(results, digest, fetchers):
+    """Look up cached results for the artifacts the checks will open.
+
+    fetchers is a list of (context, fetcher) pairs.  This runs before anything
+    is downloaded, so that artifacts with cached results are not downloaded
+    at all.
+    """
+    lookups = [(context, fetcher, classifier) for context, fetcher in fetchers
+               for classifier, mode in fetcher.planned if mode == 'open']
+    pool = get_fetch_pool()
+    checksum = lambda lookup: lookup[1].checksum(lookup[2])
+    sums = pool.map(checksum, lookups) if pool is not None else map(checksum, lookups)
+    for (context, fetcher, classifier), sha1 in zip(lookups, sums):
+        if sha1 is None:
+            continue
+        key = results.key(digest, context, fetcher.path + fetcher.filename(classifier), sha1)
+        fetcher.result_keys[classifier] = key
+        messages = results.get(key)
+        if messages is not None:
+            fetcher.results[classifier] = messages
+
+#
+# In-run memo
+#
+
+class ArtifactMemo:
+    """Artifacts downloaded and checked earlier in this run.
+
+    Vendordeps often share maven artifacts (a library and its replay variant,
+    or the same release listed for several years), so each artifact is
+    downloaded and inspected only once per run and the messages are reported
+    again for every file that references it.  Check results are small and all
+    kept; downloaded contents are kept up to max_size bytes, least recently
+    used first out.  Downloads are keyed by fetcher.memo_key(), which
+    includes the mirror list since the failures reported depend on it.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.downloads = collections.OrderedDict()
+        self.results = {}
+        # time.monotonic() each download or result that included fetch
+        # failures was added at; see forget_failures()
+        self.failed_at = {}
+
+    @staticmethod
+    def result_size(result):
+        if isinstance(result, bytes):
+            return len(result)
+        if isinstance(result, io.BytesIO):
+            return result.getbuffer().nbytes
+        if isinstance(result, (RangeFile, MappedFile)):
+            return result.size
+        return 0
+
+    def has(self, key):
+        return key in self.downloads or key in self.results
+
+    def get_download(self, key):
+        """Returns a download's (fn, result, log), or None."""
+        found = self.downloads.get(key)
+        if found is None:
+            return None
+        self.downloads.move_to_end(key)
+        fn, result, log, size = found
+        if hasattr(result, 'seek'):
+            result.seek(0)
+        return fn, result, log
+
+    def put_download(self, key, fn, result, log):
+        size = self.result_size(result)
+        if size > self.max_size or key in self.downloads:
+            return
+        self.downloads[key] = (fn, result, log, size)
+        self.size += size
+        if any(level is None for level, s in log):
+            self.failed_at[('download', key)] = time.monotonic()
+        while self.size > self.max_size:
+            _, (_, _, _, size) = self.downloads.popitem(last=False)
+            self.size -= size
+
+    def get_result(self, key, check):
+        """Returns (messages, expires) for a check of a download, or None."""
+        return self.results.get(key, {}).get(check)
+
+    def put_result(self, key, check, messages, expires):
+        self.results.setdefault(key, {})[check] = (messages, expires)
+        if expires:
+            self.failed_at[('result', key, check)] = time.monotonic()
+
+    def forget_failures(self, max_age):
+        """Drop the downloads and results that included fetch failures more
+        than max_age seconds ago, as the artifacts may have been published
+        since (see --serve)."""
+        now = time.monotonic()
+        for entry, added in list(self.failed_at.items()):
+            if now - added < max_age:
+                continue
+            del self.failed_at[entry]
+            if entry[0] == 'download':
+                found = self.downloads.pop(entry[1], None)
+                if found is not None:
+                    self.size -= found[3]
+            else:
+                self.results.get(entry[1], {}).pop(entry[2], None)
+
+artifact_memo = None
+
+def get_artifact_memo():
+    global artifact_memo
+    if artifact_memo is None or artifact_memo.max_size != memo_max_size:
+        artifact_memo = ArtifactMemo(memo_max_size)
+    return artifact_memo
+
+#
+# Concurrent downloads
+#
+
+class FetchPool:
+    """Bounded pool of download threads with a per-host concurrency cap"""
+    def __init__(self, jobs, per_host):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        self.per_host = per_host
+        self.lock = threading.Lock()
+        self.host_slots = {}
+
+    def host_slot(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            slot = self.host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host)
+                self.host_slots[host] = slot
+        return slot
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def map(self, fn, items):
+        return self.executor.map(fn, items)
+
+fetch_pool = None
+
+def get_fetch_pool():
+    """Returns the shared download pool, or None if downloads are sequential."""
+    global fetch_pool
+    if jobs <= 1:
+        return None
+    if fetch_pool is None:
+        fetch_pool = FetchPool(jobs, jobs_per_host)
+    return fetch_pool
+
+def host_slot(url):
+    pool = get_fetch_pool()
+    if pool is None:
+        return contextlib.nullcontext()
+    return pool.host_slot(url)
+
+class Prefetcher:
+    """Downloads a file's artifacts ahead of the checks that consume them.
+
+    Artifacts are queued in the order the checks will ask for them and at most
+    window downloads are outstanding at any time, so memory use stays bounded
+    no matter how many artifacts a file references.
+    """
+    def __init__(self, pool, window):
+        self.pool = pool
+        self.window = window
+        self.queue = collections.deque()
+        self.inflight = 0
+
+    def add(self, fetcher, classifier, mode):
+        self.queue.append((fetcher, classifier, mode))
+        self.fill()
+
+    def fill(self):
+        while self.queue and self.inflight < self.window:
+            fetcher, classifier, mode = self.queue.popleft()
+            fetcher.pending[classifier, mode] = self.pool.submit(fetcher.timed_download, classifier, mode)
+            self.inflight += 1
+
+    def take(self, fetcher, classifier, mode):
+        """Returns the download future for an artifact, or None if it was never queued."""
+        future = fetcher.pending.pop((classifier, mode), None)
+        if future is not None:
+            self.inflight -= 1
+            self.fill()
+        else:
+            try:
+                self.queue.remove((fetcher, classifier, mode))
+            except ValueError:
+                pass
+        return future
+
+    def discard(self, fetcher):
+        """Drop the downloads of a fetcher whose checks are done.  A check
+        that gives up early never takes some of them, and they must not keep
+        using up the window."""
+        for future in fetcher.pending.values():
+            future.cancel()
+            self.inflight -= 1
+        fetcher.pending.clear()
+        self.queue = collections.deque(entry for entry in self.queue if entry[0] is not fetcher)
+        self.fill()
+
+#
+# Mirror selection
+#
+
+def host_key(url):
+    parts = urllib.parse.urlsplit(url)
+    return '{0}://{1}'.format(parts.scheme, parts.netloc)
+
+class MirrorStats:
+    """Response latency and health of each maven host.
+
+    Every response the connection pool gets updates moving averages of the
+    host's time to first byte and of the fraction of requests it answered
+    (a 404 is an answer; a failed connection or a 5xx status is not).
+    MavenFetcher asks the healthiest, fastest host listed for an artifact
+    first, and only probes the others.  With a cache directory, the averages
+    are kept in it so later runs start with what earlier runs learned.
+    """
+    alpha = 0.3
+    # forget hosts that have not been used for a week
+    max_age = 7 * 24 * 3600
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hosts = self.read() if path is not None else {}
+        self.dirty = set()
+
+    def read(self):
+        try:
+            hosts = json.loads(self.path.read_bytes())
+            now = time.time()
+            return {host: stats for host, stats in hosts.items()
+                    if now - stats['updated'] < self.max_age and 0 <= stats['health'] <= 1}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def record(self, host, latency=None, ok=True):
+        """Record a request to host that got a response after latency
+        seconds, or that failed if ok is not set."""
+        with self.lock:
+            stats = self.hosts.get(host)
+            if stats is None:
+                stats = self.hosts[host] = {'latency': None, 'health': 1.0, 'requests': 0}
+            if latency is not None:
+                if stats['latency'] is None:
+                    stats['latency'] = latency
+                else:
+                    stats['latency'] += self.alpha * (latency - stats['latency'])
+            stats['health'] += self.alpha * ((1.0 if ok else 0.0) - stats['health'])
+            stats['requests'] += 1
+            stats['updated'] = time.time()
+            self.dirty.add(host)
+
+    def order(self, urls):
+        """Returns the indexes of urls, best first: hosts that mostly fail go
+        last, the rest fastest first.  Hosts without a measured latency keep
+        their place ahead of slower ones, so they get measured."""
+        def key(n):
+            stats = self.hosts.get(host_key(urls[n]))
+            if stats is None:
+                return (False, 0.0, n)
+            return (stats['health'] < 0.5, stats['latency'] or 0.0, n)
+        with self.lock:
+            return sorted(range(len(urls)), key=key)
+
+    def save(self):
+        """Merge the hosts updated since the last save into the stored
+        statistics, which other runs may have updated meanwhile."""
+        if self.path is None:
+            return
+        with self.lock:
+            updated = {host: dict(self.hosts[host]) for host in self.dirty}
+            self.dirty.clear()
+        if not updated:
+            return
+        hosts = self.read()
+        hosts.update(updated)
+        try:
+            ArtifactCache.write(self.path, json.dumps(hosts, indent=1, sort_keys=True).encode())
+        except OSError:
+            pass
+
+mirror_stats = None
+
+def get_mirror_stats():
+    global mirror_stats
+    path = pathlib.Path(cache_directory) / '.mirrors.json' if cache_directory else None
+    if mirror_stats is None or mirror_stats.path != path:
+        mirror_stats = MirrorStats(path)
+    return mirror_stats
+
+def mirror_order(urls):
+    """The order to try urls in, as indexes into urls"""
+    if listed_mirror_order:
+        return list(range(len(urls)))
+    return get_mirror_stats().order(urls)
+
 #
 # Maven helpers
 #
 
+# statuses worth retrying: rate limiting and overloaded or restarting servers
+RETRY_STATUSES = (429, 502, 503, 504)
+
+def fetch_url(url, method='GET', headers=None, out=None):
+    """Fetch url with retries.  Returns (status, headers, body).  If out is
+    given, the body is written to that file object instead, and body is None.
+
+    Connection failures, timeouts, stalls and RETRY_STATUSES responses are
+    retried up to --retries times after a jittered, exponentially growing
+    delay.  Other error statuses raise HTTPError; running out of retries or
+    of the file's time budget raises URLError.  Only use for idempotent
+    requests.
+    """
+    import http.client
+    attempt = 0
+    while True:
+        try:
+            remaining_time()
+            with host_slot(url), http_pool.open(url, method, headers) as f:
+                if out is None:
+                    body = f.read()
+                else:
+                    out.seek(0)
+                    out.truncate()
+                    body = None
+                    if isinstance(f, PooledResponse):
+                        f.stream(out.write)
+                    else:
+                        shutil.copyfileobj(f, out)
+                response = getattr(f, 'response', f)
+                return response.status, response.headers, body
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES or attempt >= retries:
+                raise
+        except TimeBudgetExceeded:
+            raise
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            if attempt >= retries:
+                raise e if isinstance(e, urllib.error.URLError) else urllib.error.URLError(e)
+        delay = random.uniform(0.5, 1.5) * min(0.5 * 2 ** attempt, 8)
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            raise TimeBudgetExceeded()
+        # this runs on download threads, so only report it when debugging
+        if verbose >= 2:
+            print('retrying "{0}" in {1:.1f}s'.format(url, delay), file=sys.stderr)
+        time.sleep(delay)
+        attempt += 1
+
+def probe_url(url):
+    """Check that url exists without downloading it.  Raises HTTPError if
+    not, or URLError if the servers cannot be reached."""
+    try:
+        fetch_url(url, method='HEAD')
+    except urllib.error.HTTPError as e:
+        if e.code not in (403, 405, 501):
+            raise
+        # some servers refuse HEAD requests; fall back to a full GET
+        fetch_url(url)
+
+def fetch_sha1(url):
+    """Fetch the checksum maven publishes alongside an artifact, or None"""
+    try:
+        status, headers, body = fetch_url(url + '.sha1')
+        sha1 = body.decode('ascii', 'replace').split()
+    except urllib.error.URLError:
+        return None
+    if not sha1 or not re.fullmatch('[0-9a-fA-F]{40}', sha1[0]):
+        return None
+    return sha1[0].lower()
+
+class MappedFile(io.RawIOBase):
+    """Seekable, read-only file object over a memory map or other buffer.
+
+    view() returns zero-copy slices of the contents, so zip members stored
+    without compression can be inspected in place.  The map is left to the
+    garbage collector rather than closed, as views of it may still be in use.
+    """
+    def __init__(self, buf):
+        self.map = buf
+        self.size = len(buf)
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise OSError(errno.EINVAL, 'negative seek position {0}'.format(offset))
+        self.pos = offset
+        return self.pos
+
+    def read(self, n=-1):
+        end = self.size if n is None or n < 0 else min(self.pos + n, self.size)
+        data = self.map[self.pos:end] if end > self.pos else b''
+        self.pos = max(self.pos, end)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def view(self, offset, size):
+        return memoryview(self.map)[offset:offset + size]
+
+    def release(self):
+        """Drop the pages read so far from memory; they are read from the
+        file again if needed."""
+        if hasattr(self.map, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+            self.map.madvise(mmap.MADV_DONTNEED)
+
+def map_file(f):
+    """Map the contents of the real file f as a MappedFile; f may be closed
+    afterwards."""
+    f.flush()
+    if os.fstat(f.fileno()).st_size == 0:
+        return MappedFile(b'')
+    return MappedFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def spooled_result(spool, mode):
+    """The download() result for an artifact downloaded to a
+    SpooledTemporaryFile: small ones are kept in memory, larger ones mapped."""
+    size = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+    if mode == 'fetch':
+        return spool.read()
+    if size > spool_size:
+        return map_file(spool)
+    return io.BytesIO(spool.read())
+
+@contextlib.contextmanager
+def artifact_zip(f):
+    """ZipFile over a downloaded artifact.  The pages of a mapped artifact
+    are released afterwards, as the memo may keep it for later files."""
+    try:
+        with ZipFile(f) as zf:
+            yield zf
+    finally:
+        if isinstance(f, MappedFile):
+            f.release()
+
+def read_member(zf, name):
+    """The contents of a zip member as a buffer.
+
+    Members stored without compression in a MappedFile or RangeFile are
+    returned as a zero-copy view.  Large compressed members are decompressed
+    to a memory mapped temporary file rather than into memory.
+    """
+    info = zf.getinfo(name)
+    view = getattr(zf.fp, 'view', None)
+    if view is not None and not info.flag_bits & 1:
+        header = bytes(view(info.header_offset, 30))
+        if len(header) == 30 and header[:4] == b'PK\x03\x04':
+            name_len, extra_len = struct.unpack_from('<HH', header, 26)
+            # for a RangeFile, this also fetches the member in one request
+            data = view(info.header_offset + 30 + name_len + extra_len, info.compress_size)
+            if len(data) == info.compress_size and info.compress_type == ZIP_STORED:
+                if zlib.crc32(data) != info.CRC:
+                    raise BadZipFile('Bad CRC-32 for file {0!r}'.format(name))
+                return data
+    if info.file_size <= spool_size:
+        return zf.read(info)
+    with tempfile.TemporaryFile() as tmp:
+        with zf.open(info) as member:
+            shutil.copyfileobj(member, tmp, 1 << 20)
+        return map_file(tmp).map
+
+class RangeFile:
+    """Seekable, read-only file object over a remote file.
+
+    Data is fetched with HTTP range requests as it is read, and kept, so a
+    ZipFile opened on it only downloads the end of central directory record,
+    the central directory and the members that are actually read.  The
+    fetched data is kept in a SpooledTemporaryFile, so it only stays in
+    memory up to --spool_size.
+    """
+    block_size = 64 << 10
+
+    def __init__(self, url, size, start, data):
+        """data is a file holding the bytes fetched from start on"""
+        self.url = url
+        self.size = size
+        self.pos = 0
+        self.store = tempfile.SpooledTemporaryFile(spool_size)
+        self.map = None
+        # (start, length, offset in store) of each fetched range
+        self.segments = []
+        self.add_segment(start, data)
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position {0}'.format(offset))
+        self.pos = offset
+        return self.pos
+
+    def add_segment(self, start, data, length=None):
+        """Append length bytes (by default all) of the file data, positioned
+        at its current offset, as the bytes from start on"""
+        offset = self.store.seek(0, os.SEEK_END)
+        if length is None:
+            shutil.copyfileobj(data, self.store, 1 << 20)
+        else:
+            while length > 0:
+                chunk = data.read(min(length, 1 << 20))
+                if not chunk:
+                    break
+                self.store.write(chunk)
+                length -= len(chunk)
+        self.segments.append((start, self.store.tell() - offset, offset))
+
+    def segment(self, offset, end):
+        """Returns the offset in store of the bytes offset to end, fetching
+        them first if needed"""
+        for start, length, stored in self.segments:
+            if start <= offset and end <= start + length:
+                return stored + offset - start
+        self.fetch(offset, min(max(end, offset + self.block_size), self.size))
+        start, length, stored = self.segments[-1]
+        return stored + offset - start
+
+    def read(self, n=-1):
+        end = self.size if n is None or n < 0 else min(self.pos + n, self.size)
+        if end <= self.pos:
+            return b''
+        self.store.seek(self.segment(self.pos, end))
+        result = self.store.read(end - self.pos)
+        self.pos = end
+        return result
+
+    def view(self, offset, size):
+        """The bytes at offset as a buffer, fetching them first if needed.
+        Large ranges are a view of the store mapped from disk."""
+        end = min(offset + size, self.size)
+        stored = self.segment(offset, end)
+        if end - offset <= spool_size:
+            self.store.seek(stored)
+            return memoryview(self.store.read(end - offset))
+        self.store.rollover()
+        self.store.flush()
+        if self.map is None or len(self.map) < stored + end - offset:
+            self.map = mmap.mmap(self.store.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self.map)[stored:stored + end - offset]
+
+    def fetch(self, start, end):
+        if verbose >= 2:
+            print('fetching bytes {0}-{1} of "{2}"'.format(start, end - 1, self.url))
+        with tempfile.SpooledTemporaryFile(spool_size) as data:
+            status, headers, body = fetch_url(self.url, headers={'Range': 'bytes={0}-{1}'.format(start, end - 1)}, out=data)
+            # unless the server sent the whole file after all
+            data.seek(start if status != 206 else 0)
+            self.add_segment(start, data, end - start)
+
+    def close(self):
+        self.segments = []
+        self.map = None
+        self.store.close()
+
+def open_url_ranged(url):
+    """Open url as a seekable file object, starting with a range request for
+    its tail.  Falls back to downloading the whole file if the server does not
+    support range requests."""
+    spool = tempfile.SpooledTemporaryFile(spool_size)
+    status, headers, body = fetch_url(url, headers={'Range': 'bytes=-{0}'.format(RangeFile.block_size)}, out=spool)
+    content_range = headers.get('Content-Range', '')
+    if status != 206 or not content_range.startswith('bytes ') or content_range[6:].startswith('0-'):
+        # the whole file
+        return spooled_result(spool, 'open')
+    span, size = content_range[6:].split('/')
+    spool.seek(0)
+    with spool:
+        return RangeFile(url, int(size), int(span.split('-')[0]), spool)
+
 class MavenFetcher:
-    def __init__(self, urls, group, artifact, version, ext):
+    def __init__(self, urls, group, artifact, version, ext, prefetcher=None):
         self.urls = [url + ('' if url.endswith('/') else '/') for url in urls]
         self.group = group
         self.artifact = artifact
         self.version = version
         self.ext = ext
         self.path = '/'.join(group.split('.')) + '/' + artifact + '/' + version + '/'
-
-    def fetch(self, classifier, failok=False):
+        self.prefetcher = prefetcher
+        self.pending = {}
+        self.planned = []
+        self.results = {}
+        self.result_keys = {}
+        self.failures = 0
+        # (classifier, mode) of each download that failed for a reason
+        # other than an HTTP error status; appended to by download threads
+        self.transient = []
+
+    def filename(self, classifier):
         fn = self.artifact + '-' + self.version
         if classifier is not None:
             fn += '-' + classifier
         fn += '.' + self.ext
+        return fn
 
+    def prefetch(self, classifier, mode='fetch'):
+        """Note an artifact the checks will ask for; call in the order they will."""
+        self.planned.append((classifier, mode))
+
+    def memo_key(self, classifier, mode):
+        if local_maven:
+            # local artifacts may be rebuilt in place between checks (see
+            # --serve), so tell the builds apart
+            try:
+                st = os.stat(os.path.join(local_maven, self.path, self.filename(classifier)))
+                stamp = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamp = None
+            return (tuple(self.urls), self.path + self.filename(classifier), mode, stamp)
+        return (tuple(self.urls), self.path + self.filename(classifier), mode)
+
+    def start(self):
+        """Start downloading the planned artifacts that are still needed in the
+        background."""
+        if self.prefetcher is not None and not local_maven:
+            memo = get_artifact_memo()
+            for classifier, mode in self.planned:
+                if classifier not in self.results and not memo.has(self.memo_key(classifier, mode)):
+                    self.prefetcher.add(self, classifier, mode)
+
+    def checksum(self, classifier):
+        """Returns the artifact's sha1, or None if no repo has one.
+
+        Safe to call from download threads.
+        """
+        fn = self.filename(classifier)
+        if local_maven:
+            try:
+                with open(os.path.join(local_maven, self.path, fn), 'rb') as f:
+                    return hashlib.sha1(f.read()).hexdigest()
+            except IOError:
+                return None
+        cache = get_artifact_cache()
+        if cache is not None:
+            sha1 = cache.get_sha1(self.path + fn)
+            if sha1:
+                return sha1
+            if cache.get_missing(self.path + fn, self.urls) is not None:
+                return None
+        for n in mirror_order(self.urls):
+            sha1 = fetch_sha1(self.urls[n] + self.path + fn)
+            if sha1 is not None:
+                if cache is not None:
+                    cache.put_sha1(self.path + fn, sha1)
+                return sha1
+        return None
+
+    def download(self, classifier, mode='fetch'):
+        """Fetch an artifact without reporting anything.
+
+        Safe to call from download threads.  Returns (fn, result, log), where
+        log is the list of (verbosity, text) messages the fetch produced, in
+        order; a verbosity of None marks a fetch failure warning.  result is
+        None if the artifact could not be fetched, otherwise depending on mode:
+
+        'fetch': the artifact's contents
+        'open': a seekable file object over the contents; unless a download
+                cache is in use, the contents are read with range requests as
+                they are needed
+        'probe': True; the artifact is only checked for existence
+
+        The contents are only downloaded from the first repo that has the
+        artifact; the remaining repos are just probed so missing mirrors are
+        still reported.  With the contents in the download cache, every repo
+        is probed, so the report does not depend on what is cached.
+        """
+        fn = self.filename(classifier)
         result = None
+        log = []
 
         if local_maven:
             path = os.path.join(local_maven, self.path, fn)
-            if verbose >= 1:
-                print('opening "{0}"'.format(path))
+            log.append((1, 'opening "{0}"'.format(path)))
             try:
                 with open(path, 'rb') as f:
-                    result = f.read()
+                    if mode == 'probe':
+                        result = True
+                    elif mode == 'open':
+                        result = map_file(f)
+                    else:
+                        result = f.read()
             except IOError as e:
-                if not failok:
-                    warn('could not open file: {1}'.format(path, e))
+                log.append((None, 'could not open file: {1}'.format(path, e)))
         else:
-            for baseurl in self.urls:
-                url = baseurl + self.path + fn
-                maybe_cached_file = None
-                if cache_directory:
-                    maybe_cached_file = cache_directory / (self.path + fn)
-                    if maybe_cached_file.exists():
-                        if verbose >= 2:
-                            print(f"Found a cache hit for {maybe_cached_file}")
-                        return fn, maybe_cached_file.read_bytes()
-
-                if verbose >= 1:
-                    print('downloading "{0}"'.format(url))
+            cache = get_artifact_cache()
+            hit = False
+            if cache is not None:
+                if mode == 'probe':
+                    cached = cache.contains(self.path + fn)
+                elif mode == 'open':
+                    cached = cache.open(self.path + fn)
+                else:
+                    cached = cache.get(self.path + fn)
+                if cached is not None and cached is not False:
+                    log.append((2, "Found a cache hit for {0}".format(cache.entry_path(self.path + fn))))
+                    result = cached
+                    hit = True
+                failures = cache.get_missing(self.path + fn, self.urls)
+                if failures is not None:
+                    log.append((2, "Found a cached miss for {0}".format(cache.entry_path(self.path + fn))))
+                    log.extend((None, failure) for failure in failures)
+                    return fn, None, log
+
+            # Ask the best mirror first, but log (and so report) in the
+            # order of mavenUrls so the output does not depend on timing.
+            # full downloads are spooled to disk once they get large
+            data = None
+            data_url = None
+            failures = {}
+            logs = [[] for baseurl in self.urls]
+            missing = True
+            for n in mirror_order(self.urls):
+                url = self.urls[n] + self.path + fn
                 try:
-                    with urlopener.open(url) as f:
-                        result = f.read()
-                    if maybe_cached_file:
-                        maybe_cached_file.parent.mkdir(parents=True, exist_ok=True)
-                        maybe_cached_file.write_bytes(result)
-                except urllib.error.HTTPError as e:
-                    if not failok:
-                        warn('could not fetch url "{0}": {1}'.format(url, e))
+                    if not hit and (full_downloads or (mode != 'probe' and result is None)):
+                        logs[n].append((1, 'downloading "{0}"'.format(url)))
+                        if mode == 'open' and cache is None and not full_downloads:
+                            result = open_url_ranged(url)
+                        else:
+                            spool = tempfile.SpooledTemporaryFile(spool_size)
+                            fetch_url(url, out=spool)
+                            data = spool
+                            data_url = url
+                            result = spool
+                    else:
+                        logs[n].append((1, 'checking "{0}"'.format(url)))
+                        probe_url(url)
+                        if result is None:
+                            result = True
+                except urllib.error.URLError as e:
+                    failures[n] = 'could not fetch url "{0}": {1}'.format(url, e)
+                    logs[n].append((None, failures[n]))
+                    missing = missing and getattr(e, 'code', None) in (404, 410)
+                    if not isinstance(e, urllib.error.HTTPError):
+                        self.transient.append((classifier, mode))
+            failures = [failures[n] for n in sorted(failures)]
+            for entries in logs:
+                log.extend(entries)
+
+            if cache is not None:
+                if data_url is not None:
+                    if not cache.put_file(self.path + fn, data, fetch_sha1(data_url)):
+                        log.append((1, 'checksum mismatch for "{0}", not caching'.format(data_url)))
+                    elif mode == 'open':
+                        # use the cached copy rather than keep another
+                        result = cache.open(self.path + fn) or result
+                elif result is None and missing:
+                    cache.put_missing(self.path + fn, self.urls, failures)
+            if result is data and data is not None:
+                result = spooled_result(data, mode)
+
+        if mode == 'probe' and result is not None:
+            # --full-downloads fetched the contents anyway
+            result = True
+        return fn, result, log
+
+    def timed_download(self, classifier, mode='fetch'):
+        """download(), also returning the seconds it took and the bytes it
+        received: (fn, result, log, seconds, bytes)"""
+        start = time.perf_counter()
+        start_bytes = transferred()
+        fn, result, log = self.download(classifier, mode)
+        return fn, result, log, time.perf_counter() - start, transferred() - start_bytes
+
+    def get(self, classifier, mode, failok):
+        memo = get_artifact_memo()
+        with profiled('fetch', self.filename(classifier)) as frame:
+            future = None
+            if self.prefetcher is not None:
+                future = self.prefetcher.take(self, classifier, mode)
+            found = memo.get_download(self.memo_key(classifier, mode))
+            if found is not None:
+                fn, result, log = found
+            else:
+                if future is not None:
+                    fn, result, log, seconds, nbytes = future.result()
+                    if frame is not None:
+                        # received by a download thread, so not counted yet
+                        frame.extra_bytes = nbytes
+                else:
+                    fn, result, log, seconds, nbytes = self.timed_download(classifier, mode)
+                if frame is not None:
+                    frame.download_seconds = seconds
+                if (classifier, mode) not in self.transient:
+                    memo.put_download(self.memo_key(classifier, mode), fn, result, log)
+
+        # report in the same order a sequential fetch would have
+        for level, s in log:
+            if level is None:
+                self.failures += 1
+                if not failok:
+                    warn(s)
+            elif verbose >= level:
+                print(s)
 
         return fn, result
 
+    def fetch(self, classifier, failok=False):
+        """Fetch an artifact, reporting any failures.  Returns (fn, contents)."""
+        return self.get(classifier, 'fetch', failok)
+
+    def open(self, classifier, failok=False):
+        """Like fetch(), but returns a seekable file object over the contents."""
+        return self.get(classifier, 'open', failok)
+
+    def probe(self, classifier, failok=False):
+        """Like fetch(), but only checks that the artifact exists; returns
+        True instead of the contents."""
+        return self.get(classifier, 'probe', failok)
+
 #
 # Java artifact checks
 #
 
+# Only the existence of the Java artifacts is checked, so they are probed
+# rather than downloaded.
+def prefetch_java_artifacts(dep, fetcher):
+    for classifier in [None, 'sources', 'javadoc']:
+        fetcher.prefetch(classifier, 'probe')
+
 def check_java_artifacts(dep, fetcher):
     #maven_check_pom_java(urls, group_id, artifact_id, version)
 
-    fn, jar = fetcher.fetch(None)
+    fn, jar = fetcher.probe(None)
     if jar is None:
         error('could not fetch java jar')
 
-    fn, sources = fetcher.fetch('sources')
+    fn, sources = fetcher.probe('sources')
     if sources is None:
         warn('could not fetch java sources')
 
-    fn, javadoc = fetcher.fetch('javadoc')
+    fn, javadoc = fetcher.probe('javadoc')
     if javadoc is None:
         warn('could not fetch java docs')
 
+#
+# Shared library inspection
+#
+
+class ElfInfo:
+    """The parts of an ELF shared library that check_cpp_shared_linux looks at"""
+    def __init__(self, machine, flags, needed, frc_symbols):
+        self.machine = machine
+        self.flags = flags
+        self.needed = needed
+        self.frc_symbols = frc_symbols
+
+ELF_MACHINES = {3: 'EM_386', 40: 'EM_ARM', 62: 'EM_X86_64', 183: 'EM_AARCH64'}
+EF_ARM_ABI_FLOAT_SOFT = 0x200
+EF_ARM_ABI_FLOAT_HARD = 0x400
+ELF_FRC_SYMBOL = re.compile(rb'_ZNK?3frc')
+
+def elf_machine_name(machine):
+    name = ELF_MACHINES.get(machine)
+    if name is None:
+        load_elftools()
+        from elftools.elf.enums import ENUM_E_MACHINE
+        name = next((k for k, v in ENUM_E_MACHINE.items() if v == machine and k != '_default_'), machine)
+    return name
+
+def read_elf_info(data):
+    """Read the machine type, DT_NEEDED entries and globally defined frc::
+    symbols of an ELF file.
+
+    Works directly on data (bytes, mmap or any other buffer).  Only the
+    dynamic sections and symbol tables are parsed, and a symbol table is only
+    walked if its string table contains a name in the frc namespace at all.
+    Gives the same results as read_elf_info_elftools().
+    """
+    buf = memoryview(data)
+    if bytes(buf[:4]) != b'\x7fELF':
+        raise ValueError('not an ELF file')
+    is64 = buf[4] == 2
+    endian = '<' if buf[5] == 1 else '>'
+    if is64:
+        machine, = struct.unpack_from(endian + 'H', buf, 18)
+        shoff, flags = struct.unpack_from(endian + 'QI', buf, 40)
+        shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', buf, 58)
+        shdr = endian + 'IIQQQQIIQQ'
+        dyn = endian + 'qQ'
+        sym_name = endian + 'I{0}x'
+        sym = endian + 'IBBHQQ'
+    else:
+        machine, = struct.unpack_from(endian + 'H', buf, 18)
+        shoff, flags = struct.unpack_from(endian + 'II', buf, 32)
+        shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', buf, 46)
+        shdr = endian + 'IIIIIIIIII'
+        dyn = endian + 'iI'
+        sym_name = endian + 'I{0}x'
+        sym = endian + 'IIIBBH'
+
+    sections = []
+    if shoff:
+        if shnum == 0:
+            # more sections than fit in e_shnum; the count is in section 0
+            shnum = struct.unpack_from(shdr, buf, shoff)[5]
+        for n in range(shnum):
+            sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_addralign, sh_entsize = \
+                struct.unpack_from(shdr, buf, shoff + n * shentsize)
+            sections.append((sh_type, sh_offset, sh_size, sh_link, sh_entsize))
+
+    def section_data(n):
+        sh_type, sh_offset, sh_size = sections[n][:3]
+        if sh_type == 8:  # SHT_NOBITS
+            return b''
+        return buf[sh_offset:sh_offset + sh_size]
+
+    def get_string(strtab, offset):
+        # look for the terminator a chunk at a time, so short names do not
+        # copy the rest of the table but long template names are not cut off
+        chunk = 4096
+        while True:
+            end = bytes(strtab[offset:offset + chunk]).find(b'\0')
+            if end >= 0 or offset + chunk >= len(strtab):
+                break
+            chunk *= 4
+        if end < 0:
+            return bytes(strtab[offset:]).decode('utf-8', 'replace')
+        return bytes(strtab[offset:offset + end]).decode('utf-8', 'replace')
+
+    needed = []
+    frc_symbols = []
+    for sh_type, sh_offset, sh_size, sh_link, sh_entsize in sections:
+        if sh_type == 6:  # SHT_DYNAMIC
+            strtab = section_data(sh_link)
+            entsize = struct.calcsize(dyn)
+            for off in range(sh_offset, sh_offset + sh_size - entsize + 1, entsize):
+                d_tag, d_val = struct.unpack_from(dyn, buf, off)
+                if d_tag == 0:  # DT_NULL
+                    break
+                if d_tag == 1:  # DT_NEEDED
+                    needed.append(get_string(strtab, d_val))
+        elif sh_type in (2, 11):  # SHT_SYMTAB, SHT_DYNSYM
+            strtab = section_data(sh_link)
+            # offsets of every name in the frc namespace; most libraries have
+            # none, in which case the symbols themselves are never looked at
+            candidates = set(m.start() for m in ELF_FRC_SYMBOL.finditer(strtab))
+            if not candidates:
+                continue
+            entsize = sh_entsize or struct.calcsize(sym)
+            table = buf[sh_offset:sh_offset + sh_size - sh_size % entsize]
+            for n, (st_name,) in enumerate(struct.iter_unpack(sym_name.format(entsize - 4), table)):
+                if st_name not in candidates:
+                    continue
+                if is64:
+                    st_name, st_info, st_other, st_shndx, st_value, st_size = struct.unpack_from(sym, table, n * entsize)
+                else:
+                    st_name, st_value, st_size, st_info, st_other, st_shndx = struct.unpack_from(sym, table, n * entsize)
+                if st_info >> 4 != 1:  # STB_GLOBAL
+                    continue
+                if st_shndx == 0:  # SHN_UNDEF
+                    continue
+                frc_symbols.append(get_string(strtab, st_name))
+
+    return ElfInfo(elf_machine_name(machine), flags, needed, frc_symbols)
+
+def read_elf_info_elftools(libf):
+    """Read the same information as read_elf_info() using pyelftools"""
+    elf = load_elftools()
+    lib = elf.elffile.ELFFile(libf)
+    needed = []
+    for section in lib.iter_sections():
+        if not isinstance(section, elf.dynamic.DynamicSection):
+            continue
+        for tag in section.iter_tags():
+            if tag.entry.d_tag == 'DT_NEEDED':
+                needed.append(tag.needed)
+
+    frc_symbols = []
+    for section in lib.iter_sections():
+        if not isinstance(section, elf.sections.SymbolTableSection):
+            continue
+        for symbol in section.iter_symbols():
+            if symbol['st_info']['bind'] != 'STB_GLOBAL':
+                continue
+            if symbol['st_shndx'] == 'SHN_UNDEF':
+                continue
+            if symbol.name.startswith('_ZN3frc') or symbol.name.startswith('_ZNK3frc'):
+                frc_symbols.append(symbol.name)
+
+    return ElfInfo(lib['e_machine'], lib['e_flags'], needed, frc_symbols)
+
+class PeInfo:
+    """The parts of a PE (Windows) library that check_cpp_shared_windows looks at"""
+    def __init__(self, machine, imports):
+        self.machine = machine
+        self.imports = imports
+
+PE_MACHINES = {0x14c: 'IMAGE_FILE_MACHINE_I386', 0x8664: 'IMAGE_FILE_MACHINE_AMD64', 0xaa64: 'IMAGE_FILE_MACHINE_ARM64'}
+
+def pe_machine_name(machine):
+    name = PE_MACHINES.get(machine)
+    if name is None:
+        name = load_pefile().MACHINE_TYPE.get(machine, '0x{0:x}'.format(machine))
+    return name
+
+def read_pe_info(data):
+    """Read the machine type and the names of the imported DLLs of a PE file.
+
+    Works directly on data (bytes, mmap or any other buffer).  Only the
+    headers, the section table and the import directory are parsed.  Gives
+    the same results as read_pe_info_pefile() for well-formed files.
+    """
+    buf = memoryview(data)
+    if bytes(buf[:2]) != b'MZ':
+        raise ValueError('not a PE file')
+    e_lfanew, = struct.unpack_from('<I', buf, 0x3c)
+    if bytes(buf[e_lfanew:e_lfanew + 4]) != b'PE\0\0':
+        raise ValueError('not a PE file')
+    machine, nsections, _, _, _, optsize, _ = struct.unpack_from('<HHIIIHH', buf, e_lfanew + 4)
+    opt = e_lfanew + 24
+    magic, = struct.unpack_from('<H', buf, opt)
+    if magic == 0x10b:  # PE32
+        file_alignment, = struct.unpack_from('<I', buf, opt + 36)
+        ndirs, = struct.unpack_from('<I', buf, opt + 92)
+        dirs = opt + 96
+        thunk = '<I'
+    elif magic == 0x20b:  # PE32+
+        file_alignment, = struct.unpack_from('<I', buf, opt + 36)
+        ndirs, = struct.unpack_from('<I', buf, opt + 108)
+        dirs = opt + 112
+        thunk = '<Q'
+    else:
+        raise ValueError('unknown optional header magic 0x{0:x}'.format(magic))
+
+    sections = []
+    for n in range(nsections):
+        vsize, vaddr, rawsize, rawptr = struct.unpack_from('<IIII', buf, opt + optsize + n * 40 + 8)
+        if file_alignment >= 0x200:
+            rawptr &= ~0x1ff
+        sections.append((vaddr, max(vsize, rawsize), rawptr))
+
+    def offset(rva):
+        for vaddr, size, rawptr in sections:
+            if vaddr <= rva < vaddr + size:
+                return rva - vaddr + rawptr
+        if rva < len(buf):
+            # in the headers, which are mapped at the start of the image
+            return rva
+        raise ValueError('RVA 0x{0:x} outside of the file'.format(rva))
+
+    def get_string(rva):
+        start = offset(rva)
+        end = bytes(buf[start:start + 0x200]).find(b'\0')
+        if end < 0:
+            raise ValueError('unterminated string at RVA 0x{0:x}'.format(rva))
+        return bytes(buf[start:start + end]).decode('utf-8')
+
+    imports = []
+    if ndirs > 1:
+        rva, size = struct.unpack_from('<II', buf, dirs + 8)  # IMAGE_DIRECTORY_ENTRY_IMPORT
+        while rva:
+            original_first_thunk, _, _, name, first_thunk = struct.unpack_from('<IIIII', buf, offset(rva))
+            if not (original_first_thunk or name or first_thunk):
+                break
+            rva += 20
+            # like pefile, skip descriptors that import nothing
+            if not struct.unpack_from(thunk, buf, offset(original_first_thunk or first_thunk))[0]:
+                continue
+            imports.append(get_string(name))
+
+    return PeInfo(pe_machine_name(machine), imports)
+
+def read_pe_info_pefile(data):
+    """Read the same information as read_pe_info() using pefile"""
+    pefile = load_pefile()
+    lib = pefile.PE(data=data, fast_load=True)
+    lib.parse_data_directories(directories=[pefile.DIRECTORY_ENTRY['IMAGE_DIRECTORY_ENTRY_IMPORT']])
+    imports = [entry.dll.decode('utf-8') for entry in getattr(lib, 'DIRECTORY_ENTRY_IMPORT', [])]
+    return PeInfo(pefile.MACHINE_TYPE.get(lib.FILE_HEADER.Machine, '0x{0:x}'.format(lib.FILE_HEADER.Machine)), imports)
+
 #
 # C++ artifact checks
 #
@@ -278,29 +2279,33 @@ def check_cpp_headers(zf):
     if not hfiles:
         warn('no C++ headers in headers zip')
 
-def check_cpp_shared_linux(libf, arch, debug, wpilibYear):
-    lib = ELFFile(libf)
+def check_cpp_shared_linux(libdata, arch, debug, wpilibYear):
+    try:
+        lib = read_elf_info(libdata)
+    except (ValueError, IndexError, struct.error):
+        # malformed or unusual file; let pyelftools have a go at it
+        lib = read_elf_info_elftools(io.BytesIO(libdata))
 
     # check expected arch (for known arches)
     if arch == 'x86':
-        if lib['e_machine'] != 'EM_386':
-            error('arch mismatch, expected {0}, got {1}'.format('EM_386', lib['e_machine']))
+        if lib.machine != 'EM_386':
+            error('arch mismatch, expected {0}, got {1}'.format('EM_386', lib.machine))
     elif arch == 'x86-64':
-        if lib['e_machine'] != 'EM_X86_64':
-            error('arch mismatch, expected {0}, got {1}'.format('EM_X86_64', lib['e_machine']))
+        if lib.machine != 'EM_X86_64':
+            error('arch mismatch, expected {0}, got {1}'.format('EM_X86_64', lib.machine))
     elif arch == 'athena' or arch == 'raspbian':
-        if lib['e_machine'] != 'EM_ARM':
-            error('arch mismatch, expected {0}, got {1}'.format('EM_ARM', lib['e_machine']))
+        if lib.machine != 'EM_ARM':
+            error('arch mismatch, expected {0}, got {1}'.format('EM_ARM', lib.machine))
         else:
-            if arch == 'athena' and (lib['e_flags'] & E_FLAGS.EF_ARM_ABI_FLOAT_SOFT) == 0:
+            if arch == 'athena' and (lib.flags & EF_ARM_ABI_FLOAT_SOFT) == 0:
                 error('expected soft float')
-            if arch == 'raspbian' and (lib['e_flags'] & E_FLAGS.EF_ARM_ABI_FLOAT_HARD) == 0:
+            if arch == 'raspbian' and (lib.flags & EF_ARM_ABI_FLOAT_HARD) == 0:
                 error('expected hard float')
-            if arch == 'systemcore' and (lib['e_flags'] & E_FLAGS.EF_ARM_ABI_FLOAT_HARD) == 0:
+            if arch == 'systemcore' and (lib.flags & EF_ARM_ABI_FLOAT_HARD) == 0:
                 error('expected hard float')
     elif arch == 'systemcore':
-        if lib['e_machine'] != 'EM_AARCH64':
-            error('arch mismatch, expected {0}, got {1}'.format('EM_AARCH64', lib['e_machine']))
+        if lib.machine != 'EM_AARCH64':
+            error('arch mismatch, expected {0}, got {1}'.format('EM_AARCH64', lib.machine))
 
     # check required libraries (excluding known libraries)
     exclude_libs = set([
@@ -351,74 +2356,75 @@ def check_cpp_shared_linux(libf, arch, debug, wpilibYear):
                 'libFRC_NetworkCommunication.so.26',
                 ])
     dep_libs = []
-    for section in lib.iter_sections():
-        if not isinstance(section, DynamicSection):
+    for needed in lib.needed:
+        if needed in exclude_libs or needed.startswith('libopencv_'):
             continue
-        for tag in section.iter_tags():
-            if tag.entry.d_tag == 'DT_NEEDED':
-                if tag.needed in exclude_libs or tag.needed.startswith('libopencv_'):
-                    continue
-                dep_libs.append(tag.needed)
+        dep_libs.append(needed)
 
     if dep_libs:
         info('additional libs required: {0}'.format(dep_libs))
 
     # check to make sure no symbols are defined in frc:: namespace
-    for section in lib.iter_sections():
-        if not isinstance(section, SymbolTableSection):
-            continue
-        for symbol in section.iter_symbols():
-            if symbol['st_info']['bind'] != 'STB_GLOBAL':
-                continue
-            if symbol['st_shndx'] == 'SHN_UNDEF':
-                continue
-            if symbol.name.startswith('_ZN3frc') or symbol.name.startswith('_ZNK3frc'):
-                error('symbol defined in frc namespace: {0}'.format(symbol.name))
+    for name in lib.frc_symbols:
+        error('symbol defined in frc namespace: {0}'.format(name))
+
+# DLLs that every Windows library may import: the system and C runtime
+# libraries, and WPILib's own (with a d suffix in debug builds)
+WINDOWS_SYSTEM_LIBS = frozenset(l.lower() for l in [
+    'cscorejni.dll',
+    'ntcorejni.dll',
+    'wpiHaljni.dll',
+    'KERNEL32.dll',
+    'api-ms-win-crt-runtime-l1-1-0.dll',
+    'api-ms-win-crt-heap-l1-1-0.dll',
+    'api-ms-win-crt-utility-l1-1-0.dll',
+    'api-ms-win-crt-convert-l1-1-0.dll',
+    'api-ms-win-crt-stdio-l1-1-0.dll',
+    'api-ms-win-crt-filesystem-l1-1-0.dll',
+    'api-ms-win-crt-locale-l1-1-0.dll',
+    'api-ms-win-crt-math-l1-1-0.dll',
+    'api-ms-win-crt-string-l1-1-0.dll',
+    'api-ms-win-crt-environment-l1-1-0.dll',
+    'api-ms-win-crt-time-l1-1-0.dll',
+    ])
+WINDOWS_WPILIB_LIBS = [
+    'wpilibc',
+    'cameraserver',
+    'cscore',
+    'ntcore',
+    'wpiHal',
+    'wpiutil',
+    'wpimath',
+    'wpinet',
+    'wpilibNewCommands',
+    'MSVCP140',
+    'VCRUNTIME140',
+    'VCRUNTIME140_1',
+    'ucrtbase',
+    ]
+# debug -> the lowercase names of the DLLs not reported as additional libs
+WINDOWS_EXCLUDE_LIBS = {
+    debug: WINDOWS_SYSTEM_LIBS | frozenset('{0}{1}.dll'.format(l, 'd' if debug else '').lower() for l in WINDOWS_WPILIB_LIBS)
+    for debug in (False, True)
+}
+# expected machine type of each known Windows arch
+WINDOWS_ARCH_MACHINES = {'x86': 'IMAGE_FILE_MACHINE_I386', 'x86-64': 'IMAGE_FILE_MACHINE_AMD64', 'arm64': 'IMAGE_FILE_MACHINE_ARM64'}
 
 def check_cpp_shared_windows(libdata, arch, debug):
-    lib = pefile.PE(data=libdata)
+    try:
+        lib = read_pe_info(libdata)
+    except (ValueError, IndexError, struct.error):
+        # malformed or unusual file; let pefile have a go at it
+        lib = read_pe_info_pefile(bytes(libdata))
+
+    # check expected arch (for known arches)
+    expected = WINDOWS_ARCH_MACHINES.get(arch)
+    if expected is not None and lib.machine != expected:
+        error('arch mismatch, expected {0}, got {1}'.format(expected, lib.machine))
 
     # check required libraries (excluding known libraries)
-    exclude_libs = set(l.lower() for l in [
-        'cscorejni.dll',
-        'ntcorejni.dll',
-        'wpiHaljni.dll',
-        'KERNEL32.dll',
-        'api-ms-win-crt-runtime-l1-1-0.dll',
-        'api-ms-win-crt-heap-l1-1-0.dll',
-        'api-ms-win-crt-utility-l1-1-0.dll',
-        'api-ms-win-crt-convert-l1-1-0.dll',
-        'api-ms-win-crt-stdio-l1-1-0.dll',
-        'api-ms-win-crt-filesystem-l1-1-0.dll',
-        'api-ms-win-crt-locale-l1-1-0.dll',
-        'api-ms-win-crt-math-l1-1-0.dll'
-        'api-ms-win-crt-string-l1-1-0.dll',
-        'api-ms-win-crt-environment-l1-1-0.dll', 
-        'api-ms-win-crt-time-l1-1-0.dll',
-        'api-ms-win-crt-math-l1-1-0.dll',
-        'api-ms-win-crt-string-l1-1-0.dll'
-        ])
-    exclude_libs.update('{0}{1}.dll'.format(l, 'd' if debug else '').lower() for l in [
-        'wpilibc',
-        'cameraserver',
-        'cscore',
-        'ntcore',
-        'wpiHal',
-        'wpiutil',
-        'wpimath',
-        'wpinet',
-        'wpilibNewCommands',
-        'MSVCP140',
-        'VCRUNTIME140',
-        'VCRUNTIME140_1',
-        'ucrtbase',
-        ])
-    dep_libs = []
-    for entry in lib.DIRECTORY_ENTRY_IMPORT:
-        dll = entry.dll.decode('utf-8')
-        if dll.lower() in exclude_libs:
-            continue
-        dep_libs.append(dll)
+    exclude_libs = WINDOWS_EXCLUDE_LIBS[debug]
+    dep_libs = [dll for dll in lib.imports if dll.lower() not in exclude_libs]
     if dep_libs:
         info('additional libs required: {0}'.format(dep_libs))
 
@@ -495,13 +2501,15 @@ def check_cpp_binary(zf, libName, platform, build, wpilibYear):
     if not libpaths:
         error('library {0} not found'.format('/'.join(expectpath)))
     elif libType == 'shared':
-        lib = zf.read(libpaths[0])
+        lib = read_member(zf, libpaths[0])
         is_debug = build.endswith('debug')
         message_context.append(libName)
         if os == 'linux':
-            check_cpp_shared_linux(io.BytesIO(lib), arch, is_debug, wpilibYear)
+            with profiled('elf'):
+                check_cpp_shared_linux(lib, arch, is_debug, wpilibYear)
         elif os == 'windows':
-            check_cpp_shared_windows(lib, arch, is_debug)
+            with profiled('pe'):
+                check_cpp_shared_windows(lib, arch, is_debug)
         message_context.pop()
 
     if debugName is not None:
@@ -510,96 +2518,171 @@ def check_cpp_binary(zf, libName, platform, build, wpilibYear):
         if not dbgpaths:
             info('debug symbols file {0} not found'.format('/'.join(expectpath)))
 
-def check_cpp_artifacts(dep, fetcher, wpilibYear):
-    # sources
+def cpp_binary_builds(dep):
+    """(platform, build) pairs of a C++ dependency, in the order they are checked"""
+    return [(platform, build) for platform in dep.get('binaryPlatforms', [])
+            for build in ['', 'debug', 'static', 'staticdebug']]
+
+def prefetch_cpp_artifacts(dep, fetcher):
     if 'sourcesClassifier' in dep:
-        fn, sources = fetcher.fetch(dep['sourcesClassifier'])
-        if sources is None:
-            warn('could not fetch sources')
-        else:
-            try:
-                with ZipFile(io.BytesIO(sources)) as zf:
-                    message_context.append(fn)
+        fetcher.prefetch(dep['sourcesClassifier'], 'open')
+    if 'headerClassifier' in dep:
+        fetcher.prefetch(dep['headerClassifier'], 'open')
+    for platform, build in cpp_binary_builds(dep):
+        fetcher.prefetch(platform + build, 'open')
+
+def read_failed(fetcher, fn, e):
+    """Report a range request that failed while a zip was being read"""
+    fetcher.failures += 1
+    fetcher.transient.append((fn, 'read'))
+    error('could not download "{0}": {1}'.format(fn, e))
+
+def check_cpp_sources_zip(fetcher, classifier):
+    fn, sources = fetcher.open(classifier)
+    if sources is None:
+        warn('could not fetch sources')
+    else:
+        try:
+            with profiled('zip', fn), artifact_zip(sources) as zf:
+                message_context.append(fn)
+                try:
                     check_cpp_sources(zf)
+                finally:
+                    message_context.pop()
+        except BadZipFile:
+            error('got bad sources zip')
+        except urllib.error.URLError as e:
+            read_failed(fetcher, fn, e)
+
+def check_cpp_headers_zip(fetcher, classifier):
+    fn, headers = fetcher.open(classifier)
+    if headers is None:
+        error('could not fetch headers')
+    else:
+        try:
+            with profiled('zip', fn), artifact_zip(headers) as zf:
+                message_context.append(fn)
+                try:
+                    check_cpp_headers(zf)
+                finally:
                     message_context.pop()
-            except BadZipFile:
-                error('got bad sources zip')
+        except BadZipFile:
+            error('got bad headers zip')
+        except urllib.error.URLError as e:
+            read_failed(fetcher, fn, e)
+
+def check_cpp_binary_zip(fetcher, libName, sharedLibrary, platform, build, wpilibYear):
+    # sharedLibrary specifies whether shared or static libraries are
+    # used; we still check both if both exist but it's not an error
+    # if the other kind is missing
+    failok = (sharedLibrary and build.startswith('static') or
+            not sharedLibrary and not build.startswith('static'))
+    fn, binary = fetcher.open(platform + build, failok=failok)
+    if binary is None:
+        if failok:
+            info('could not fetch optional binary platform {0} build {1}'.format(platform, build))
+        elif platform == 'windowsx86':
+            warn('WPILib no longer builds for 32-bit')
+        else:
+            error('could not fetch required C++ binary platform {0} build {1}'.format(platform, build))
+    else:
+        try:
+            with profiled('zip', fn), artifact_zip(binary) as zf:
+                message_context.append(fn)
+                try:
+                    check_cpp_binary(zf, libName, platform, build, wpilibYear)
+                finally:
+                    message_context.pop()
+        except BadZipFile:
+            error('got bad binary zip')
+        except urllib.error.URLError as e:
+            read_failed(fetcher, fn, e)
+
+def check_cpp_artifacts(dep, fetcher, wpilibYear):
+    # sources
+    if 'sourcesClassifier' in dep:
+        run_cached(fetcher, dep['sourcesClassifier'], check_cpp_sources_zip, dep['sourcesClassifier'])
     else:
         info('no sources')
 
     # headers
     if 'headerClassifier' in dep:
-        fn, headers = fetcher.fetch(dep['headerClassifier'])
-        if headers is None:
-            error('could not fetch headers')
-        else:
-            try:
-                with ZipFile(io.BytesIO(headers)) as zf:
-                    message_context.append(fn)
-                    check_cpp_headers(zf)
-                    message_context.pop()
-            except BadZipFile:
-                error('got bad headers zip')
+        run_cached(fetcher, dep['headerClassifier'], check_cpp_headers_zip, dep['headerClassifier'])
     else:
         info('no headers')
 
     # binaries
-    for platform in dep.get('binaryPlatforms', []):
-        for build in ['', 'debug', 'static', 'staticdebug']:
-            # sharedLibrary specifies whether shared or static libraries are
-            # used; we still check both if both exist but it's not an error
-            # if the other kind is missing
-            failok = (dep['sharedLibrary'] and build.startswith('static') or
-                    not dep['sharedLibrary'] and not build.startswith('static'))
-            fn, binary = fetcher.fetch(platform + build, failok=failok)
-            if binary is None:
-                if failok:
-                    info('could not fetch optional binary platform {0} build {1}'.format(platform, build))
-                elif platform == 'windowsx86':
-                    warn('WPILib no longer builds for 32-bit')
-                else:
-                    error('could not fetch required C++ binary platform {0} build {1}'.format(platform, build))
-            else:
-                try:
-                    with ZipFile(io.BytesIO(binary)) as zf:
-                        message_context.append(fn)
-                        check_cpp_binary(zf, dep['libName'], platform, build, wpilibYear)
-                        message_context.pop()
-                except BadZipFile:
-                    error('got bad binary zip')
+    for platform, build in cpp_binary_builds(dep):
+        run_cached(fetcher, platform + build, check_cpp_binary_zip, dep['libName'], dep['sharedLibrary'], platform, build, wpilibYear)
 
-def check_jni_artifacts(dep, fetcher, wpilibYear):
+def prefetch_jni_artifacts(dep, fetcher):
     for platform in dep.get('validPlatforms', []):
-        fn, binary = fetcher.fetch(platform)
-        if binary is None:
-            if platform == 'windowsx86':
-                warn('WPILib no longer builds for 32-bit')
-            else:
-                error('could not fetch required JNI binary platform {0}'.format(platform))
+        fetcher.prefetch(platform, 'open')
+
+def check_jni_binary_zip(fetcher, platform, wpilibYear):
+    fn, binary = fetcher.open(platform)
+    if binary is None:
+        if platform == 'windowsx86':
+            warn('WPILib no longer builds for 32-bit')
         else:
-            try:
-                with ZipFile(io.BytesIO(binary)) as zf:
-                    message_context.append(fn)
+            error('could not fetch required JNI binary platform {0}'.format(platform))
+    else:
+        try:
+            with profiled('zip', fn), artifact_zip(binary) as zf:
+                message_context.append(fn)
+                try:
                     check_cpp_binary(zf, None, platform, '', wpilibYear)
+                finally:
                     message_context.pop()
-            except BadZipFile:
-                error('got bad binary zip')
+        except BadZipFile:
+            error('got bad binary zip')
+        except urllib.error.URLError as e:
+            read_failed(fetcher, fn, e)
+
+def check_jni_artifacts(dep, fetcher, wpilibYear):
+    for platform in dep.get('validPlatforms', []):
+        run_cached(fetcher, platform, check_jni_binary_zip, platform, wpilibYear)
 
 #
 # Top level checks
 #
 
+def fetch_json_url(url):
+    """Returns the parsed jsonUrl and the number of bytes received"""
+    start_bytes = transferred()
+    status, headers, body = fetch_url(url)
+    return json.loads(body), transferred() - start_bytes
+
 def check_file(filename):
     if not os.path.exists(filename) :
         return
 
-    with open(filename, 'rt') as f:
-        j = json.load(f)
+    with profiled('load'):
+        with open(filename, 'rb') as f:
+            contents = f.read()
+        j = json.loads(contents)
 
+    with profiled('offline'):
+        wpilibYear = check_file_offline(filename, j)
+    if wpilibYear is None or lint:
+        return
+
+    changes = get_change_set()
+    if changes is not None and not changes.is_changed(filename):
+        if verbose >= 1:
+            print('unchanged since {0}, not checking artifacts'.format(changes.rev))
+        return
+
+    check_file_artifacts(j, contents, wpilibYear)
+
+def check_file_offline(filename, j):
+    """Checks that need nothing but the file itself.  Returns the wpilibYear
+    the artifacts should be checked against, or None if the file is too
+    broken to go on."""
     # overall schema check
-    check_schema(j, json_schema, ())
+    validate_schema(j, ())
     if got_error:
-        return
+        return None
 
     # UUID should be a UUID
     try:
@@ -671,53 +2754,380 @@ def check_file(filename):
         if not foundsystemcore and wpilibYearOnly == "2027":
             warn('linuxsystemcore validPlatform not found in any "jniDependencies"')
 
+    return wpilibYear
+
+def check_file_artifacts(j, contents, wpilibYear):
+    """Checks of the jsonUrl and the maven artifacts"""
+    changes = get_change_set()
+    def unchecked(kind, prefix):
+        """The (index, dependency) pairs of j[kind] whose artifacts need checking"""
+        deps = []
+        for n, dep in enumerate(j[kind]):
+            if changes is not None and changes.is_known(j, kind, dep):
+                if verbose >= 1:
+                    print('{0}.{1} unchanged since {2}, not checking artifacts'.format(prefix, n, changes.rev))
+                continue
+            deps.append((n, dep))
+        return deps
+    javaDeps = unchecked('javaDependencies', 'javaDep')
+    cppDeps = unchecked('cppDependencies', 'cppDep')
+    jniDeps = unchecked('jniDependencies', 'jniDep')
+
+    pool = get_fetch_pool()
+    prefetcher = Prefetcher(pool, 2 * jobs) if pool is not None else None
+    javaFetchers = [MavenFetcher(j['mavenUrls'], dep['groupId'], dep['artifactId'], dep['version'], 'jar', prefetcher)
+                    for n, dep in javaDeps]
+    cppFetchers = [MavenFetcher(j['mavenUrls'], dep['groupId'], dep['artifactId'], dep['version'], 'zip', prefetcher)
+                   for n, dep in cppDeps]
+    jniFetchers = [MavenFetcher(j['mavenUrls'], dep['groupId'], dep['artifactId'], dep['version'], 'jar' if dep['isJar'] else 'zip', prefetcher)
+                   for n, dep in jniDeps]
+
+    for (n, dep), fetcher in zip(javaDeps, javaFetchers):
+        prefetch_java_artifacts(dep, fetcher)
+    for (n, dep), fetcher in zip(cppDeps, cppFetchers):
+        prefetch_cpp_artifacts(dep, fetcher)
+    for (n, dep), fetcher in zip(jniDeps, jniFetchers):
+        prefetch_jni_artifacts(dep, fetcher)
+
+    results = get_result_cache()
+    if results is not None:
+        digest = hashlib.sha256(contents + file_config.digest.encode()).hexdigest()
+        with profiled('lookup'):
+            lookup_cached_results(results, digest,
+                                  [('cppDep.{0}'.format(n), fetcher) for (n, dep), fetcher in zip(cppDeps, cppFetchers)] +
+                                  [('jniDep.{0}'.format(n), fetcher) for (n, dep), fetcher in zip(jniDeps, jniFetchers)])
+
+    # Start downloading in the background, in the order the checks below
+    # consume the results; all reporting still happens in check order.
+    jsonUrlFuture = None
+    if pool is not None:
+        jsonUrlFuture = pool.submit(fetch_json_url, j['jsonUrl'])
+        for fetcher in javaFetchers + cppFetchers + jniFetchers:
+            fetcher.start()
+
     # Try to fetch the jsonUrl; we just want to make sure it's fetchable and a
     # JSON file, it won't necessarily match this file.
+    import http.client
     if verbose >= 1:
         print('downloading "{0}"'.format(j['jsonUrl']))
-    try:
-        with urlopener.open(j['jsonUrl']) as f:
-            j2 = json.load(f)
-    except (urllib.error.HTTPError, http.client.IncompleteRead) as e:
-        warn('could not fetch jsonUrl "{0}": {1}'.format(j['jsonUrl'], e))
+    with profiled('jsonUrl') as frame:
+        try:
+            if jsonUrlFuture is not None:
+                j2, nbytes = jsonUrlFuture.result()
+                if frame is not None:
+                    frame.extra_bytes = nbytes
+            else:
+                j2, nbytes = fetch_json_url(j['jsonUrl'])
+        except (urllib.error.URLError, http.client.IncompleteRead) as e:
+            warn('could not fetch jsonUrl "{0}": {1}'.format(j['jsonUrl'], e))
 
     # Fetch artifacts from listed maven repos.  We have to be able to at least
     # fetch each artifact from one repo, but warn otherwise (as things may not
     # yet be mirrored, for example).
-    for n, dep in enumerate(j['javaDependencies']):
-        fetcher = MavenFetcher(j['mavenUrls'], dep['groupId'], dep['artifactId'], dep['version'], 'jar')
+    for (n, dep), fetcher in zip(javaDeps, javaFetchers):
         message_context.append('javaDep.{0}'.format(n))
         check_java_artifacts(dep, fetcher)
         message_context.pop()
+        if prefetcher is not None:
+            prefetcher.discard(fetcher)
 
-    for n, dep in enumerate(j['cppDependencies']):
-        fetcher = MavenFetcher(j['mavenUrls'], dep['groupId'], dep['artifactId'], dep['version'], 'zip')
+    for (n, dep), fetcher in zip(cppDeps, cppFetchers):
         message_context.append('cppDep.{0}'.format(n))
         check_cpp_artifacts(dep, fetcher, wpilibYear)
         message_context.pop()
+        if prefetcher is not None:
+            prefetcher.discard(fetcher)
 
-    for n, dep in enumerate(j['jniDependencies']):
-        fetcher = MavenFetcher(j['mavenUrls'], dep['groupId'], dep['artifactId'], dep['version'], 'jar' if dep['isJar'] else 'zip')
+    for (n, dep), fetcher in zip(jniDeps, jniFetchers):
         message_context.append('jniDep.{0}'.format(n))
         check_jni_artifacts(dep, fetcher, wpilibYear)
         message_context.pop()
+        if prefetcher is not None:
+            prefetcher.discard(fetcher)
 
 #
-# Main
+# Check daemon
 #
 
-def main():
+class FileWatcher:
+    """Polls vendordep files, and the .ini/.cfg files next to them, for
+    changes.  files is the list of files to watch, or None to watch every
+    bundle directory (picking up files added to them)."""
+    def __init__(self, files=None):
+        self.files = files
+        self.state = {}
+
+    def snapshot(self):
+        state = {}
+        for fn in self.files if self.files is not None else bundle_files():
+            basefn = os.path.splitext(fn)[0]
+            stamps = []
+            for path in [fn, basefn + '.ini', basefn + '.cfg']:
+                try:
+                    st = os.stat(path)
+                    stamps.append((st.st_mtime_ns, st.st_size))
+                except OSError:
+                    stamps.append(None)
+            state[fn] = tuple(stamps)
+        return state
+
+    def poll(self):
+        """Returns the existing files that were added or changed since the
+        last poll"""
+        state = self.snapshot()
+        changed = [fn for fn, stamps in state.items() if stamps != self.state.get(fn) and stamps[0] is not None]
+        self.state = state
+        return changed
+
+def send_message(conn, message):
+    conn.sendall(json.dumps(message).encode() + b'\n')
+
+def report_message(report):
+    return {'file': report.filename, 'output': report.output, 'summary': report.summary(),
+            'errors': report.errors, 'warnings': report.warnings}
+
+def serve_check(fn):
+    """check_one() for the daemon, which must survive files that cannot be
+    checked (such as one an editor is half way through saving)"""
+    try:
+        return check_one(fn, capture=True)
+    except Exception as e:
+        report = Report(fn)
+        report.write('stderr', '{0}: ERROR: {1}: {2}\n'.format(fn, type(e).__name__, e))
+        report.errors = 1
+        return report
+
+class CheckServer:
+    """The --serve daemon.
+
+    Checks run one at a time on the main thread, so the module level state
+    they share (the in-run memo of downloaded and checked artifacts, the
+    connection pool, the download threads and the caches) stays warm from one
+    check to the next.  A thread accepts clients on a local TCP port; each
+    sends one JSON request line, either {"files": [...]} to have those files
+    checked or {"follow": true} to receive the results of every recheck of a
+    watched file, and gets one JSON line per checked file back.  Any other
+    request gets an {"error": ...} line back.
+    """
+    def __init__(self, files):
+        import queue
+        import socket
+        self.watcher = FileWatcher(files or None)
+        self.listener = socket.create_server(('127.0.0.1', serve_port))
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.followers = []
+
+    def accept(self):
+        while True:
+            try:
+                conn, addr = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.read_request, args=(conn,), daemon=True).start()
+
+    def read_request(self, conn):
+        try:
+            request = json.loads(conn.makefile('rb').readline())
+        except (OSError, ValueError):
+            conn.close()
+            return
+        if not isinstance(request, dict):
+            self.reject(conn, 'request must be a JSON object')
+        elif request.get('follow'):
+            with self.lock:
+                self.followers.append(conn)
+        else:
+            files = request.get('files', [])
+            if not isinstance(files, list) or not all(isinstance(fn, str) for fn in files):
+                self.reject(conn, '"files" must be a list of file names')
+            else:
+                self.requests.put((conn, files))
+
+    @staticmethod
+    def reject(conn, error):
+        try:
+            send_message(conn, {'error': error})
+        except OSError:
+            pass
+        conn.close()
+
+    def broadcast(self, message):
+        with self.lock:
+            followers = list(self.followers)
+        for conn in followers:
+            try:
+                send_message(conn, message)
+            except OSError:
+                conn.close()
+                with self.lock:
+                    self.followers.remove(conn)
+
+    def check_files(self, files, conn=None):
+        """Check files, sending the results to conn, or to the followers and
+        our own output if conn is None"""
+        # missing artifacts may have been published since they were checked
+        get_artifact_memo().forget_failures(cache_negative_ttl)
+        start = time.perf_counter()
+        errors = 0
+        for fn in files:
+            report = serve_check(fn)
+            errors += report.errors
+            if conn is None:
+                report.replay()
+                print(report.summary(), file=sys.stderr)
+                self.broadcast(report_message(report))
+                continue
+            try:
+                send_message(conn, report_message(report))
+            except OSError:
+                break
+        if conn is None:
+            print('checked {0} files in {1:.2f}s'.format(len(files), time.perf_counter() - start), file=sys.stderr)
+        else:
+            try:
+                send_message(conn, {'done': True, 'errors': errors})
+            except OSError:
+                pass
+            conn.close()
+
+    def run(self):
+        import queue
+        threading.Thread(target=self.accept, daemon=True).start()
+        print('serving on 127.0.0.1:{0}, watching {1} files'.format(
+            self.listener.getsockname()[1], len(self.watcher.snapshot())), file=sys.stderr)
+        changed = self.watcher.poll()
+        if self.watcher.files is None:
+            # with every bundle watched, only check what changes from now on
+            changed = []
+        try:
+            while True:
+                if changed:
+                    self.check_files(changed)
+                try:
+                    conn, files = self.requests.get(timeout=poll_interval)
+                    self.check_files(files, conn)
+                except queue.Empty:
+                    pass
+                changed = self.watcher.poll()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.listener.close()
+
+def run_client(files):
+    """The thin client for --serve: has the daemon check files, or with no
+    files, follows the daemon's rechecks of the files it watches.  Output is
+    the same as checking the files directly.  Returns whether there were
+    errors."""
+    import socket
+    try:
+        conn = socket.create_connection(('127.0.0.1', serve_port))
+    except OSError as e:
+        print('could not connect to check.py --serve on port {0}: {1}'.format(serve_port, e), file=sys.stderr)
+        return True
+    names = {os.path.abspath(fn): fn for fn in files}
+    if files:
+        send_message(conn, {'files': list(names)})
+    else:
+        send_message(conn, {'follow': True})
     had_errors = False
-    for fn in parse_args(sys.argv[1:]):
-        global json_filename, got_error, got_warn
-        json_filename = fn
-        got_error = 0
-        got_warn = 0
+    try:
+        for line in conn.makefile('rb'):
+            message = json.loads(line)
+            if message.get('done'):
+                break
+            if 'error' in message:
+                print('check.py --serve rejected the request: {0}'.format(message['error']), file=sys.stderr)
+                had_errors = True
+                break
+            name = names.get(message['file'], message['file'])
+            for stream, text in message['output']:
+                getattr(sys, stream).write(text.replace(message['file'], name))
+            print(message['summary'].replace(message['file'], name), file=sys.stderr)
+            if message['errors'] > 0:
+                had_errors = True
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+    return had_errors
+
+#
+# Main
+#
+
+def check_one(fn, capture=False):
+    """Check a single file and return its Report.
+
+    If capture is set, everything the check prints is recorded in the report
+    instead of being written to stdout/stderr.
+    """
+    global json_filename, got_error, got_warn, profile_entries, file_deadline
+    json_filename = fn
+    got_error = 0
+    got_warn = 0
+    del message_context[:]
+    profile_entries = [] if profile_file or profile_top else None
+    start = time.perf_counter()
+    file_deadline = time.monotonic() + file_time_budget if file_time_budget > 0 else None
+    report = Report(fn)
+    if capture:
+        redirect = contextlib.ExitStack()
+        redirect.enter_context(contextlib.redirect_stdout(ReportWriter(report, 'stdout')))
+        redirect.enter_context(contextlib.redirect_stderr(ReportWriter(report, 'stderr')))
+    else:
+        redirect = contextlib.nullcontext()
+    with redirect:
         file_config.load(fn)
         check_file(fn)
-        print('{0}: {1} errors, {2} warnings'.format(fn, got_error, got_warn), file=sys.stderr)
-        if got_error > 0:
-            had_errors = True
+        if file_deadline is not None and time.monotonic() > file_deadline:
+            error('time budget of {0:g}s used up; the remaining artifacts were not checked'.format(file_time_budget))
+    file_deadline = None
+    if mirror_stats is not None:
+        mirror_stats.save()
+    report.errors = got_error
+    report.warnings = got_warn
+    report.seconds = time.perf_counter() - start
+    report.budget = file_time_budget or None
+    report.profile = profile_entries
+    profile_entries = None
+    return report
+
+def check_captured(fn):
+    return check_one(fn, capture=True)
+
+def main():
+    argv = sys.argv[1:]
+    files = parse_args(argv)
+    if client:
+        sys.exit(1 if run_client(files) else 0)
+    if serve:
+        CheckServer(files).run()
+        return
+    had_errors = False
+    reports = []
+    if processes > 1 and len(files) > 1:
+        # Workers parse the same arguments so they share our configuration;
+        # reports are merged in command line order as they complete.
+        with concurrent.futures.ProcessPoolExecutor(min(processes, len(files)), initializer=parse_args, initargs=(argv,)) as executor:
+            for report in executor.map(check_captured, files):
+                report.replay()
+                print(report.summary(), file=sys.stderr)
+                if report.errors > 0:
+                    had_errors = True
+                reports.append(report)
+    else:
+        for fn in files:
+            report = check_one(fn)
+            print(report.summary(), file=sys.stderr)
+            if report.errors > 0:
+                had_errors = True
+            reports.append(report)
+    if profile_file:
+        write_profile(profile_file, reports)
+    if profile_top:
+        print_profile_summary(reports, profile_top)
     sys.exit(1 if had_errors else 0)
 
 if __name__ == '__main__':
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""
+Batched vendordep checker test, run by the vendordep_check_suite Bazel rule.
+
+Checks a list of vendordep files in one test process, so the interpreter
+start, the imports and the in-run artifact memo are shared by all of them.
+Each file is its own unittest test case with its own allowable error and
+warning counts.  Supports Bazel test sharding: with shard_count set, each
+shard checks every TEST_TOTAL_SHARDS'th file starting at TEST_SHARD_INDEX.
+
+Usage: check_suite.py [--allowable_errors N] [--allowable_warnings N]
+                      [--file_threshold FILE:ERRORS:WARNINGS ...]
+                      [--check_startup]
+                      [check.py options] file [file ...]
+
+Thresholds of "none" allow any number of messages.  With --check_startup,
+the first shard also checks that importing check.py does not load the
+modules it only needs for binary or network checks, and that a --lint run
+over the files and a check of a file whose results are all cached stay
+within generous time ceilings.
+"""
+
+import argparse
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import check
+
+def parse_threshold(s):
+    if s.lower() == 'none':
+        return None
+    return int(s)
+
+def parse_file_threshold(s):
+    try:
+        fn, errors, warnings = s.rsplit(':', 2)
+        return fn, (parse_threshold(errors), parse_threshold(warnings))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid file threshold "{0}"'.format(s))
+
+def parse_args(argv):
+    """Parse command line arguments.  Returns (files, thresholds) where
+    thresholds maps each file to its allowed (errors, warnings).  The
+    remaining arguments are passed to check.py."""
+    parser = argparse.ArgumentParser(description='Checks a batch of vendor json files as unit tests', add_help=False, allow_abbrev=False)
+    parser.add_argument('--allowable_errors', type=parse_threshold, default=0)
+    parser.add_argument('--allowable_warnings', type=parse_threshold, default=None)
+    parser.add_argument('--file_threshold', type=parse_file_threshold, action='append', default=[])
+    parser.add_argument('--check_startup', action='store_true')
+    args, check_args = parser.parse_known_args(argv)
+
+    files = check.parse_args(check_args)
+    thresholds = dict(args.file_threshold)
+    Startup.enabled = args.check_startup
+    Startup.files = files
+    return files, {fn: thresholds.get(fn, (args.allowable_errors, args.allowable_warnings)) for fn in files}
+
+def shard(files):
+    """Returns the files this test shard should check."""
+    total = int(os.environ.get('TEST_TOTAL_SHARDS', 1))
+    index = int(os.environ.get('TEST_SHARD_INDEX', 0))
+    # tell Bazel we support sharding
+    status_file = os.environ.get('TEST_SHARD_STATUS_FILE')
+    if status_file:
+        pathlib.Path(status_file).touch()
+    return files[index::total]
+
+def first_shard():
+    return int(os.environ.get('TEST_SHARD_INDEX', 0)) == 0
+
+# modules check.py must only import once it inspects a library or makes a request
+LAZY_MODULES = ['elftools', 'pefile', 'ssl', 'http.client', 'urllib.request']
+
+class Startup(unittest.TestCase):
+    enabled = False
+    files = []
+
+    # ceilings in seconds; generous, so that only a real regression (such as
+    # the lint path loading the binary or HTTP stack again) fails on a slow
+    # machine
+    LINT_SECONDS = 5
+    CACHED_SECONDS = 30
+
+    def setUp(self):
+        if not self.enabled or not first_shard():
+            self.skipTest('startup is not checked in this shard')
+        self.env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    def run_check(self, args):
+        """Run check.py in a fresh process; returns the seconds it took"""
+        start = time.perf_counter()
+        subprocess.run([sys.executable, check.__file__] + args, env=self.env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+    def test_import(self):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import check, sys; print(" ".join(sys.modules))'],
+                                env=self.env, capture_output=True, text=True, check=True)
+
+        modules = set(result.stdout.split())
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules, 'importing check.py loads {0}'.format(module))
+
+        # lines are "import time: self [us] | cumulative | module"
+        cumulative = [int(line.split('|')[1]) for line in result.stderr.splitlines()
+                      if line.startswith('import time:') and line.split('|')[2].strip() == 'check']
+        seconds = cumulative[0] / 1e6
+        print('importing check.py took {0:.3f}s'.format(seconds))
+
+    def test_lint(self):
+        seconds = self.run_check(['--lint'] + self.files)
+        print('check.py --lint of {0} files took {1:.3f}s (ceiling {2}s)'.format(len(self.files), seconds, self.LINT_SECONDS))
+        self.assertLessEqual(seconds, self.LINT_SECONDS)
+
+    def test_cached(self):
+        if not self.files:
+            self.skipTest('no files to check')
+        with tempfile.TemporaryDirectory(dir=os.environ.get('TEST_TMPDIR')) as cache:
+            args = ['--cache_directory', cache] + self.files[:1]
+            # the first run fills the download and result caches
+            self.run_check(args)
+            seconds = self.run_check(args)
+        print('cached check of {0} took {1:.3f}s (ceiling {2}s)'.format(self.files[0], seconds, self.CACHED_SECONDS))
+        self.assertLessEqual(seconds, self.CACHED_SECONDS)
+
+class VendordepCheck(unittest.TestCase):
+    pass
+
+def make_test(vendor_file, errors_allowed, warnings_allowed):
+    def test_check(self):
+        report = check.check_one(vendor_file, capture=True)
+        report.replay()
+        sys.stderr.flush()
+        print(report.summary())
+
+        if errors_allowed is not None:
+            self.assertLessEqual(report.errors, errors_allowed, '{0}: too many errors'.format(vendor_file))
+
+        if warnings_allowed is not None:
+            self.assertLessEqual(report.warnings, warnings_allowed, '{0}: too many warnings'.format(vendor_file))
+    return test_check
+
+def add_tests(files, thresholds):
+    for n, fn in enumerate(files):
+        name = 'test_{0:03d}_{1}'.format(n, re.sub(r'\W', '_', fn))
+        setattr(VendordepCheck, name, make_test(fn, *thresholds[fn]))
+
+if __name__ == '__main__':
+    files, thresholds = parse_args(sys.argv[1:])
+    add_tests(shard(files), thresholds)
+    unittest.main(argv=sys.argv[:1], verbosity=2)
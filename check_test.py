@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+"""
+Unit tests of check.py's own machinery (as opposed to the vendordep checks
+run by check_suite.py), against the bench/ artifact generators and local
+Maven server.
+
+Usage: check_test.py [unittest options]
+"""
+
+import concurrent.futures
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'bench'))
+
+import artifacts
+import check
+from maven_server import MavenServer
+
+def setUpModule():
+    # the local server must not be reached through a proxy
+    os.environ['NO_PROXY'] = os.environ['no_proxy'] = '127.0.0.1'
+
+class ConnectionReuse(unittest.TestCase):
+    """Requests to one host share a single keep-alive connection"""
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        for n in range(3):
+            with open(os.path.join(self.root.name, 'artifact{0}.zip'.format(n)), 'wb') as f:
+                f.write(os.urandom(100 << 10))
+        self.server = MavenServer(self.root.name)
+        self.server.start()
+        check.parse_args(['--retries', '0', 'unused.json'])
+        check.http_pool.close()
+
+    def tearDown(self):
+        check.http_pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.root.cleanup()
+
+    def test_get(self):
+        for n in range(5):
+            status, headers, body = check.fetch_url(self.server.url + 'artifact{0}.zip'.format(n % 3))
+            self.assertEqual(len(body), 100 << 10)
+        self.assertEqual(self.server.stats.snapshot()['connections'], 1)
+
+    def test_get_streamed(self):
+        for n in range(5):
+            with tempfile.TemporaryFile() as out:
+                check.fetch_url(self.server.url + 'artifact{0}.zip'.format(n % 3), out=out)
+                self.assertEqual(out.tell(), 100 << 10)
+        self.assertEqual(self.server.stats.snapshot()['connections'], 1)
+
+    def test_head(self):
+        for n in range(5):
+            check.probe_url(self.server.url + 'artifact{0}.zip'.format(n % 3))
+        self.assertEqual(self.server.stats.snapshot()['connections'], 1)
+
+    def test_mixed(self):
+        for n in range(5):
+            check.fetch_url(self.server.url + 'artifact{0}.zip'.format(n % 3))
+            check.probe_url(self.server.url + 'artifact{0}.zip'.format(n % 3))
+            with self.assertRaises(check.urllib.error.HTTPError):
+                check.probe_url(self.server.url + 'missing.zip')
+        stats = self.server.stats.snapshot()
+        self.assertEqual(stats['requests'], 15)
+        self.assertEqual(stats['connections'], 1)
+
+    def test_time_budget(self):
+        url = self.server.url + 'artifact0.zip'
+        check.fetch_url(url)
+        stats = dict(check.get_mirror_stats().hosts[check.host_key(url)])
+        check.file_deadline = time.monotonic() - 1
+        try:
+            with self.assertRaises(check.TimeBudgetExceeded):
+                check.http_pool.request('GET', url)
+        finally:
+            check.file_deadline = None
+        # running out of our own budget is not held against the host
+        self.assertEqual(check.get_mirror_stats().hosts[check.host_key(url)]['health'], stats['health'])
+        self.assertEqual(check.get_mirror_stats().hosts[check.host_key(url)]['requests'], stats['requests'])
+
+class Prefetch(unittest.TestCase):
+    """Downloads a check never takes do not use up the prefetch window"""
+
+    class Fetcher:
+        def __init__(self):
+            self.pending = {}
+
+        def timed_download(self, classifier, mode):
+            return classifier
+
+    def test_discard(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as pool:
+            prefetcher = check.Prefetcher(pool, 2)
+            abandoned, later = self.Fetcher(), self.Fetcher()
+            for classifier in ['a', 'b', 'c']:
+                prefetcher.add(abandoned, classifier, 'full')
+            # the check takes one download, then gives up
+            self.assertEqual(prefetcher.take(abandoned, 'a', 'full').result(), 'a')
+            prefetcher.discard(abandoned)
+            self.assertEqual(prefetcher.inflight, 0)
+            for classifier in ['d', 'e']:
+                prefetcher.add(later, classifier, 'full')
+            self.assertEqual(sorted(later.pending), [('d', 'full'), ('e', 'full')])
+
+class CacheEviction(unittest.TestCase):
+    """Only artifacts count toward the download cache size and are evicted"""
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as root:
+            cache = check.ArtifactCache(root, 250 << 10, 3600)
+            check.ResultCache(root, 'version', 3600).put('ab' * 32, [], False)
+            check.ArtifactCache.write(cache.directory / '.mirrors.json', os.urandom(100 << 10))
+            for n in range(3):
+                self.assertTrue(cache.put('group/artifact{0}.zip'.format(n), os.urandom(100 << 10)))
+            self.assertFalse(cache.contains('group/artifact0.zip'))
+            self.assertTrue(cache.contains('group/artifact2.zip'))
+            self.assertTrue((cache.directory / '.mirrors.json').is_file())
+            self.assertTrue(any((cache.directory / '.results').rglob('*.json')))
+            self.assertLess(cache.scan()[0], 250 << 10)
+
+class ServeRequests(unittest.TestCase):
+    """The --serve daemon answers malformed requests with an error"""
+
+    def setUp(self):
+        check.parse_args(['--port', '0', 'unused.json'])
+        self.server = check.CheckServer(['unused.json'])
+
+    def tearDown(self):
+        self.server.listener.close()
+
+    def request(self, line):
+        import socket
+        client, conn = socket.socketpair()
+        client.sendall(line + b'\n')
+        self.server.read_request(conn)
+        return client
+
+    def test_files(self):
+        with self.request(b'{"files": ["a.json"]}'):
+            conn, files = self.server.requests.get_nowait()
+            conn.close()
+        self.assertEqual(files, ['a.json'])
+
+    def test_invalid(self):
+        for line in [b'[]', b'"files"', b'null', b'{"files": "a.json"}', b'{"files": [1]}']:
+            with self.request(line) as client:
+                replies = [json.loads(reply) for reply in client.makefile('rb')]
+            self.assertEqual(len(replies), 1, line)
+            self.assertIn('error', replies[0])
+        self.assertTrue(self.server.requests.empty())
+
+class ElfInfo(unittest.TestCase):
+    """read_elf_info() agrees with the pyelftools implementation"""
+
+    def test_agrees(self):
+        rng = random.Random(7)
+        symbols = ['_ZN3frc5Robot4InitEv', '_ZNK3frc5Robot6IsBusyEv', '_ZN5other4InitEv', 'c_function']
+        for arch in artifacts.ELF_ARCHES:
+            with self.subTest(arch=arch):
+                data = artifacts.make_elf(rng, arch, 16 << 10, artifacts.LINUX_NEEDED, symbols)
+                ours = check.read_elf_info(data)
+                theirs = check.read_elf_info_elftools(io.BytesIO(data))
+                self.assertEqual(ours.machine, theirs.machine)
+                self.assertEqual(ours.flags, theirs.flags)
+                self.assertEqual(ours.needed, theirs.needed)
+                self.assertEqual(ours.frc_symbols, theirs.frc_symbols)
+                self.assertEqual(ours.needed, artifacts.LINUX_NEEDED)
+                self.assertEqual(ours.frc_symbols, symbols[:2])
+
+    def test_long_names(self):
+        rng = random.Random(7)
+        symbols = ['_ZN3frc' + 'N' * 5000 + 'Ev', '_ZN3frc5Robot4InitEv']
+        data = artifacts.make_elf(rng, 'x86-64', 16 << 10, ['lib' + 'x' * 5000 + '.so'], symbols)
+        ours = check.read_elf_info(data)
+        theirs = check.read_elf_info_elftools(io.BytesIO(data))
+        self.assertEqual(ours.needed, theirs.needed)
+        self.assertEqual(ours.frc_symbols, theirs.frc_symbols)
+        self.assertEqual(ours.frc_symbols, symbols)
+
+    def test_float_abi(self):
+        rng = random.Random(7)
+        soft = check.read_elf_info(artifacts.make_elf(rng, 'athena', 4 << 10, [], []))
+        hard = check.read_elf_info(artifacts.make_elf(rng, 'arm32', 4 << 10, [], []))
+        self.assertEqual(soft.machine, 'EM_ARM')
+        self.assertTrue(soft.flags & check.EF_ARM_ABI_FLOAT_SOFT)
+        self.assertTrue(hard.flags & check.EF_ARM_ABI_FLOAT_HARD)
+
+class PeInfo(unittest.TestCase):
+    """read_pe_info() agrees with the pefile implementation"""
+
+    def test_agrees(self):
+        rng = random.Random(7)
+        for arch in artifacts.PE_MACHINES:
+            with self.subTest(arch=arch):
+                data = artifacts.make_pe(rng, arch, 16 << 10, artifacts.WINDOWS_IMPORTS)
+                ours = check.read_pe_info(data)
+                theirs = check.read_pe_info_pefile(data)
+                self.assertEqual(ours.machine, theirs.machine)
+                self.assertEqual(ours.imports, theirs.imports)
+                self.assertEqual(ours.imports, list(artifacts.WINDOWS_IMPORTS))
+
+    def test_machines(self):
+        rng = random.Random(7)
+        for arch, machine in [('x86-64', 'IMAGE_FILE_MACHINE_AMD64'), ('arm64', 'IMAGE_FILE_MACHINE_ARM64')]:
+            data = artifacts.make_pe(rng, arch, 4 << 10, {})
+            self.assertEqual(check.read_pe_info(data).machine, machine)
+            self.assertEqual(check.read_pe_info(data).imports, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,40 @@
 import argparse
+import gzip
+import hashlib
 import json
-import shutil
+import os
+import re
+import tempfile
+from collections.abc import Callable
 from pathlib import Path
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def gzip_compress(data: bytes) -> bytes:
+    # mtime=0 and no file name keep the output byte-for-byte reproducible
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def brotli_compress(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+def compressors() -> list[tuple[str, str, Callable[[bytes], bytes]]]:
+    """(encoding, file suffix, compress function) for each available encoding"""
+    out = [("gzip", ".gz", gzip_compress)]
+    if brotli is not None:
+        out.append(("br", ".br", brotli_compress))
+    return out
+
+
+def etag_entry(data: bytes) -> dict:
+    digest = hashlib.sha256(data).hexdigest()
+    return {"etag": f'"{digest[:32]}"', "sha256": digest, "size": len(data)}
+
 def check_languages(vendordep_data: dict) -> list[str]:
     # Check if json explicitly specifies and use that first
     if "languages" in vendordep_data:
@@ -60,43 +92,235 @@ def generate_entry(
     }
 
 
-def generate_manifest_file(
-    json_files: list[Path],
-    metadata_file: Path,
-    path_prefix: str,
-    outfile: Path,
-    pretty=False,
-):
-    """Generates a manifest for all vendordep json files in json_files."""
+class BundleOutput:
+    """Writes the files of the output bundles and records which ones changed.
+
+    In incremental mode, files whose content is already in place are left
+    alone, files with the same content as one already written this run are
+    hardlinked to it (so a vendordep listed in several bundles is stored
+    once), and pruning removes output files that no longer have a source.
+    Files are always replaced atomically, never modified in place, so
+    hardlinked copies are never changed behind each other's back.
+
+    With compress set, every file also gets precompressed variants (FILE.gz,
+    and FILE.br if brotli is installed) and an entry in the ETag sidecar
+    written by write_etags().
+    """
+
+    def __init__(self, outdir: Path, incremental=False, compress=False):
+        self.outdir = outdir
+        self.incremental = incremental
+        self.compress = compress
+        self.by_digest: dict[str, Path] = {}
+        self.changed: list[str] = []
+        self.deleted: list[str] = []
+        self.etags: dict[str, dict] = {}
+
+    def relative(self, file: Path) -> str:
+        return file.relative_to(self.outdir).as_posix()
+
+    def write_bytes(self, dest: Path, data: bytes) -> bool:
+        """Writes data to dest.  Returns whether dest changed.  Only files in
+        the output directory are recorded as changed."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.incremental and dest.is_file() and file_digest(dest) == digest:
+            self.by_digest.setdefault(digest, dest)
+            return False
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            same = self.by_digest.get(digest) if self.incremental else None
+            linked = False
+            if same is not None:
+                os.unlink(tmp)
+                try:
+                    os.link(same, tmp)
+                    linked = True
+                except OSError:
+                    pass
+            if not linked:
+                Path(tmp).write_bytes(data)
+                os.chmod(tmp, 0o644)
+            os.replace(tmp, dest)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.by_digest.setdefault(digest, dest)
+        if dest.is_relative_to(self.outdir):
+            self.changed.append(self.relative(dest))
+        return True
+
+    def write_file(self, dest: Path, data: bytes) -> set[Path]:
+        """Writes dest and its compressed variants.  Returns the paths written."""
+        paths = {dest}
+        self.write_bytes(dest, data)
+        if not self.compress:
+            return paths
+        entry = etag_entry(data)
+        for encoding, suffix, compress in compressors():
+            variant = dest.with_name(dest.name + suffix)
+            compressed = compress(data)
+            self.write_bytes(variant, compressed)
+            entry[encoding] = {"path": self.relative(variant)} | etag_entry(compressed)
+            paths.add(variant)
+        self.etags[self.relative(dest)] = entry
+        return paths
+
+    def copy(self, src: Path, dest: Path) -> set[Path]:
+        return self.write_file(dest, src.read_bytes())
+
+    def prune(self, directory: Path, keep: set[Path], pattern="*"):
+        """Removes the files in directory matching pattern that are not in keep (incremental mode only)."""
+        if not self.incremental or not directory.is_dir():
+            return
+        for file in sorted(directory.glob(pattern)):
+            if file.is_file() and file not in keep:
+                file.unlink()
+                self.deleted.append(self.relative(file))
+
+    def write_etags(self, file: Path):
+        """Writes the ETag sidecar: for every file written, its ETag, sha256 and
+        size, and the same for each of its compressed variants."""
+        etags = dict(sorted(self.etags.items()))
+        self.write_bytes(file, json.dumps(etags, indent=2).encode())
+
+    def remove_etags(self, file: Path):
+        """Removes an ETag sidecar left by an earlier run with compression,
+        which would list compressed variants that are no longer written."""
+        if file.is_file():
+            file.unlink()
+            self.deleted.append(self.relative(file))
+
+    def write_changes(self, file: Path):
+        """Writes the list of changed and deleted files, relative to the output directory."""
+        file.write_text(
+            json.dumps({"changed": self.changed, "deleted": self.deleted}, indent=2),
+            newline="\n",
+        )
+
+
+def file_digest(file: Path) -> str:
+    return hashlib.sha256(file.read_bytes()).hexdigest()
+
+
+def generate_entries(
+    json_files: list[Path], metadata_file: Path, path_prefix: str
+) -> list[dict]:
     metadata_database = load_metadata(metadata_file)
     entries = []
     for file in json_files:
         entries.append(generate_entry(file, path_prefix, metadata_database))
+    return entries
+
 
+def dump_json(data, pretty=False) -> str:
     format_args = {"indent": 2} if pretty else {"separators": (",", ":")}
-    outfile.write_text(json.dumps(entries, **format_args), newline="\n")
+    return json.dumps(data, **format_args)
 
 
-def generate_bundle(year: str, root: Path, outdir: Path, pretty=False):
+def version_key(version: str):
+    """Sort key ordering library versions by semantic versioning precedence.
+
+    Tolerates the variations found in vendordeps: a leading "v", any number of
+    release components, and pre-release tags such as "beta-1", "beta1" or
+    "alpha5".  A pre-release sorts before the release it precedes.
+    """
+    version = version.strip().removeprefix("v").split("+", 1)[0]
+    release, _, prerelease = version.partition("-")
+    release_key = tuple(
+        (0, int(part), "") if part.isdigit() else (1, 0, part)
+        for part in release.split(".")
+    )
+    if not prerelease:
+        return (release_key, 1, ())
+    prerelease_key = tuple(
+        (0, int(part), "") if part.isdigit() else (1, 0, part)
+        for part in re.findall(r"\d+|[^\W\d_]+", prerelease)
+    )
+    return (release_key, 0, prerelease_key)
+
+
+def generate_index(
+    entries: list[dict], shard_prefix: str
+) -> tuple[dict[str, dict], dict[str, list[dict]]]:
+    """Splits manifest entries into a per-library index and shards.
+
+    Returns (index, shards).  The index maps each library UUID to its name,
+    latest version and shard path; each shard (keyed by the same path) lists
+    the manifest entries for every version of one library, oldest first.
+    """
+    if shard_prefix and not shard_prefix.endswith("/"):
+        shard_prefix += "/"
+    libraries: dict[str, list[dict]] = {}
+    for entry in entries:
+        libraries.setdefault(entry["uuid"], []).append(entry)
+
+    index = {}
+    shards = {}
+    for uuid, versions in sorted(libraries.items()):
+        versions.sort(key=lambda entry: version_key(entry["version"]))
+        path = f"{shard_prefix}{uuid}.json"
+        index[uuid] = {
+            "name": versions[-1]["name"],
+            "latestVersion": versions[-1]["version"],
+            "path": path,
+        }
+        shards[path] = versions
+    return index, shards
+
+
+def generate_bundle(
+    year: str,
+    root: Path,
+    outdir: Path,
+    pretty=False,
+    output: BundleOutput = None,
+    index=False,
+):
     """Generates a 'bundle' consisting of a YEAR.json manifest and a directory named YEAR containing all of the vendordep files
 
     Requires a metadata file YEAR_metadata.json, and a directory named YEAR containing the input vendordeps.
+
+    With index set, also generates a YEAR_index.json library index and a
+    directory named YEAR_libraries containing one shard per library.
     """
     json_dir = root / year
     metadata = root / f"{year}_metadata.json"
     path_prefix = year
     outdir.mkdir(parents=True, exist_ok=True)
+    if output is None:
+        output = BundleOutput(outdir)
 
     manifest_file = Path(outdir) / f"{year}.json"
     vendordeps = [file for file in json_dir.glob("*.json")]
 
-    generate_manifest_file(vendordeps, metadata, path_prefix, manifest_file, pretty)
+    entries = generate_entries(vendordeps, metadata, path_prefix)
+    manifest = dump_json(entries, pretty)
+    output.prune(outdir, output.write_file(manifest_file, manifest.encode()), f"{year}.json.*")
+
+    index_file = outdir / f"{year}_index.json"
+    shards_dir = outdir / f"{year}_libraries"
+    index_outputs = set()
+    shard_outputs = set()
+    if index:
+        library_index, shards = generate_index(entries, f"{year}_libraries")
+        index_outputs = output.write_file(index_file, dump_json(library_index, pretty).encode())
+        for path, versions in shards.items():
+            shard_outputs |= output.write_file(outdir / path, dump_json(versions, pretty).encode())
+    output.prune(outdir, index_outputs, f"{year}_index.json*")
+    output.prune(shards_dir, shard_outputs)
+    if output.incremental and not index and shards_dir.is_dir() and not any(shards_dir.iterdir()):
+        shards_dir.rmdir()
 
     # Copy all vendordeps to outdir/YEAR
     depsdir = outdir / year
     depsdir.mkdir(exist_ok=True)
+    outputs = set()
     for file in vendordeps:
-        shutil.copy(file, depsdir)
+        outputs |= output.copy(file, depsdir / file.name)
+    output.prune(depsdir, outputs)
 
 
 def main():
@@ -123,9 +347,48 @@ def main():
         action="store_true",
         help="Pretty-print the output. Without this option, output is minified.",
     )
+    parser.add_argument(
+        "--incremental",
+        "-i",
+        action="store_true",
+        help="Only rewrite output files whose content changed, hardlink identical files, and remove output vendordeps that no longer exist",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Also write a YEAR_index.json library index and per-library YEAR_libraries/UUID.json shards for each bundle",
+    )
+    parser.add_argument(
+        "--compress",
+        "-z",
+        action="store_true",
+        help="Also write reproducible .gz (and .br, if brotli is installed) copies of every file, and an ETag sidecar",
+    )
+    parser.add_argument(
+        "--etags",
+        type=Path,
+        help="File to write the ETag sidecar to with --compress. Defaults to OUTPUT/etags.json; it is only listed in --changes if it is in OUTPUT",
+    )
+    parser.add_argument(
+        "--changes",
+        type=Path,
+        help="Write a JSON list of the output files that were changed or deleted to this file",
+    )
     args = parser.parse_args()
+    if args.etags is not None:
+        if not args.compress:
+            parser.error("--etags requires --compress")
+        if args.etags.is_dir():
+            parser.error(f"--etags {args.etags} is a directory")
+    output = BundleOutput(args.output, args.incremental, args.compress)
     for year in args.year:
-        generate_bundle(year, args.root, args.output, args.pretty)
+        generate_bundle(year, args.root, args.output, args.pretty, output, args.index)
+    if args.compress:
+        output.write_etags(args.etags or args.output / "etags.json")
+    else:
+        output.remove_etags(args.output / "etags.json")
+    if args.changes:
+        output.write_changes(args.changes)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from generate_bundles import load_metadata, version_key
+
+
+class Vendordep:
+    """One vendordep file of a bundle"""
+
+    def __init__(self, file: Path, data: dict):
+        self.file = file
+        self.uuid: str = data["uuid"]
+        self.name: str = data["name"]
+        self.version: str = data["version"]
+        self.requires: list[dict] = data.get("requires", [])
+        self.conflicts_with: list[dict] = data.get("conflictsWith", [])
+
+    def __repr__(self):
+        return f"{self.name} {self.version}"
+
+
+class Resolution:
+    """What installing a vendordep pulls in.
+
+    install lists the vendordep and everything it transitively requires, in
+    breadth-first order starting with the vendordep itself.  missing maps each
+    required UUID that is not in the bundle to the errorMessage of the first
+    requirement naming it.  conflicts maps each UUID that cannot be installed
+    alongside them (declared in either direction) to its errorMessage.
+    """
+
+    def __init__(self, install: list[Vendordep], missing: dict[str, str], conflicts: dict[str, str]):
+        self.install = install
+        self.missing = missing
+        self.conflicts = conflicts
+
+    def internal_conflicts(self) -> dict[str, str]:
+        """The conflicts with vendordeps that are themselves being installed"""
+        installed = {dep.uuid for dep in self.install}
+        return {uuid: message for uuid, message in self.conflicts.items() if uuid in installed}
+
+
+class Bundle:
+    """Index over the vendordeps of one bundle directory and its YEAR_metadata.json.
+
+    Everything is loaded once; resolutions are memoized, so resolving many
+    libraries (or the same one repeatedly) does not rescan any JSON.
+    Requirements only name a UUID, so a requirement resolves to the latest
+    version of that library in the bundle.
+    """
+
+    def __init__(self, year: str, root: Path = Path()):
+        self.year = year
+        self.metadata = load_metadata(root / f"{year}_metadata.json")
+        self.versions: dict[str, list[Vendordep]] = {}
+        for file in sorted((root / year).glob("*.json")):
+            dep = Vendordep(file, json.loads(file.read_bytes()))
+            self.versions.setdefault(dep.uuid, []).append(dep)
+        for deps in self.versions.values():
+            deps.sort(key=lambda dep: version_key(dep.version))
+
+        # a conflict counts whichever side declares it; index the
+        # declarations of the latest versions (the ones that would be
+        # installed alongside) by the UUID they name
+        self.conflicted_by: dict[str, dict[str, str]] = {}
+        for uuid, deps in self.versions.items():
+            for conflict in deps[-1].conflicts_with:
+                self.conflicted_by.setdefault(conflict["uuid"], {}).setdefault(uuid, conflict["errorMessage"])
+
+        self.names = {entry["name"].lower(): uuid for uuid, entry in self.metadata.items()}
+        for uuid, deps in self.versions.items():
+            self.names.setdefault(deps[-1].name.lower(), uuid)
+        self.resolutions: dict[tuple[str, str], Resolution] = {}
+
+    def find(self, library: str) -> str:
+        """Returns the UUID of a library given its UUID or name"""
+        if library in self.versions or library in self.metadata:
+            return library
+        uuid = self.names.get(library.lower())
+        if uuid is None:
+            raise KeyError(f"No library {library} in bundle {self.year}")
+        return uuid
+
+    def get(self, uuid: str, version: str = None) -> Vendordep:
+        """Returns the vendordep for a version of a library, by default the latest"""
+        deps = self.versions.get(uuid)
+        if not deps:
+            raise KeyError(f"No vendordep for {uuid} in bundle {self.year}")
+        if version is None:
+            return deps[-1]
+        for dep in deps:
+            if dep.version == version:
+                return dep
+        raise KeyError(f"No version {version} of {deps[-1].name} in bundle {self.year}")
+
+    def resolve(self, uuid: str, version: str = None) -> Resolution:
+        """Returns the Resolution of installing a version of a library, by default the latest"""
+        root = self.get(uuid, version)
+        key = (root.uuid, root.version)
+        if key in self.resolutions:
+            return self.resolutions[key]
+
+        install = [root]
+        seen = {root.uuid}
+        missing = {}
+        for dep in install:
+            for requirement in dep.requires:
+                required = requirement["uuid"]
+                if required in seen:
+                    continue
+                seen.add(required)
+                if required in self.versions:
+                    install.append(self.versions[required][-1])
+                else:
+                    missing[required] = requirement["errorMessage"]
+
+        conflicts = {}
+        for dep in install:
+            for conflict in dep.conflicts_with:
+                conflicts.setdefault(conflict["uuid"], conflict["errorMessage"])
+            for other, message in self.conflicted_by.get(dep.uuid, {}).items():
+                conflicts.setdefault(other, message)
+
+        resolution = Resolution(install, missing, conflicts)
+        self.resolutions[key] = resolution
+        return resolution
+
+    def libraries(self) -> list[str]:
+        return sorted(self.versions)
+
+
+def resolution_json(bundle: Bundle, resolution: Resolution) -> dict:
+    def describe(uuid):
+        if uuid in bundle.versions:
+            return bundle.versions[uuid][-1].name
+        return bundle.metadata.get(uuid, {}).get("name", uuid)
+
+    return {
+        "install": [
+            {"uuid": dep.uuid, "name": dep.name, "version": dep.version, "path": dep.file.as_posix()}
+            for dep in resolution.install
+        ],
+        "missing": [
+            {"uuid": uuid, "name": describe(uuid), "errorMessage": message}
+            for uuid, message in resolution.missing.items()
+        ],
+        "conflicts": [
+            {"uuid": uuid, "name": describe(uuid), "errorMessage": message}
+            for uuid, message in resolution.conflicts.items()
+        ],
+    }
+
+
+def check_bundle(bundle: Bundle) -> bool:
+    """Resolves the latest version of every library in the bundle, printing any
+    missing requirements or libraries that require something they conflict
+    with.  Returns whether everything resolved."""
+    ok = True
+    for uuid in bundle.libraries():
+        resolution = bundle.resolve(uuid)
+        root = resolution.install[0]
+        for required, message in resolution.missing.items():
+            print(f"{bundle.year}: {root}: requires {required}, which is not in the bundle: {message}")
+            ok = False
+        for conflict, message in resolution.internal_conflicts().items():
+            print(f"{bundle.year}: {root}: requires {conflict}, which conflicts: {message}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Resolves the requirements and conflicts of vendordeps in a bundle"
+    )
+    parser.add_argument(
+        "--root",
+        "-r",
+        type=Path,
+        default=Path(),
+        help="Root directory to find metadata files and year folders. Defaults to '.'",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Resolve every library in each bundle and fail if any requirement is missing or conflicting",
+    )
+    parser.add_argument("--version", help="Version of the library to resolve. Defaults to the latest")
+    parser.add_argument(
+        "args",
+        nargs="+",
+        metavar="ARG",
+        help="Bundle and UUID or name of the library to resolve; with --check, the bundles to check",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        ok = all([check_bundle(Bundle(year, args.root)) for year in args.args])
+        sys.exit(0 if ok else 1)
+
+    if len(args.args) != 2:
+        parser.error("expected a bundle and a library")
+    year, library = args.args
+    bundle = Bundle(year, args.root)
+    try:
+        uuid = bundle.find(library)
+        resolution = bundle.resolve(uuid, args.version)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(resolution_json(bundle, resolution), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,39 @@
 load("@rules_python//python:defs.bzl", "py_test")
 
-def vendordep_check_test(vendor_file, allowable_warnings = 0, allowable_errors = 0, verbosity_level = "-v", cache_directory = None):
-    file_no_extension = vendor_file[:-5]
-
-    gen_name = file_no_extension + ".gen"
-    test_file_base = file_no_extension + "_test"
-    test_file_name = test_file_base + ".py"
-
-    cache_replacement = ""
-    if cache_directory:
-        cache_replacement = 'args.append("--cache_directory=' + cache_directory + '")'
-
-    verbosity_replacement = ""
+def vendordep_check_suite(name, vendor_files, allowable_warnings = None, allowable_errors = 0, file_thresholds = {}, files_per_shard = 3, size = "large", verbosity_level = "-v", cache_directory = None, check_startup = False):
+    """Checks vendor_files in one batched py_test, split across shards of files_per_shard files each.
+
+    A large test gets 900 seconds per shard, so with the default of 3 files
+    per shard every file has at least the 300 seconds a medium test of its
+    own would (Bazel allows at most 50 shards).
+
+    file_thresholds maps a vendor file to an (allowable_errors, allowable_warnings)
+    pair that overrides the defaults for that file; None allows any number.
+    If check_startup is set, the test also checks that importing check.py
+    does not load the modules it only needs for binary or network checks, and
+    that the --lint and fully cached paths stay within generous time ceilings.
+    """
+    args = [
+        "--allowable_errors=" + str(allowable_errors).lower(),
+        "--allowable_warnings=" + str(allowable_warnings).lower(),
+    ]
+    for vendor_file, (errors, warnings) in file_thresholds.items():
+        args.append("--file_threshold={}:{}:{}".format(vendor_file, str(errors).lower(), str(warnings).lower()))
+    if check_startup:
+        args.append("--check_startup")
     if verbosity_level:
-        verbosity_replacement = 'args.append("' + verbosity_level + '")'
-
-    test_contents = """
-
-import unittest
-from check import check_file, parse_args, file_config
-
-class VendordepCheck(unittest.TestCase):
-    def test_check(self):
-        vendor_file = "{vendor_file}"
-        warnings_allowed = {allowable_warnings}
-        errors_allowed = {allowable_errors}
-
-        args = [vendor_file]
-
-        {verbosity_replacement}
-        {cache_replacement}
-
-        parse_args(args)
-        file_config.load(vendor_file)
-        check_file(vendor_file)
-
-        from check import got_error, got_warn
-
-        print(f"Errors: {{got_error}}")
-        print(f"Warnings: {{got_warn}}")
-
-        if errors_allowed is not None:
-            self.assertLessEqual(got_error, errors_allowed)
-
-        if warnings_allowed is not None:
-            self.assertLessEqual(got_warn, warnings_allowed)
-
-
-if __name__ == "__main__":
-    unittest.main() # run all tests
-
-
-
-""".format(
-        vendor_file = vendor_file,
-        allowable_warnings = allowable_warnings,
-        allowable_errors = allowable_errors,
-        cache_replacement = cache_replacement,
-        verbosity_replacement = verbosity_replacement,
-    )
+        args.append(verbosity_level)
+    if cache_directory:
+        args.append("--cache_directory=" + cache_directory)
+    args += ["$(rootpath {})".format(f) for f in vendor_files]
 
-    native.genrule(
-        name = gen_name,
-        outs = [test_file_name],
-        cmd = "echo '{}' >> $@".format(test_contents),
-    )
     py_test(
-        name = test_file_base,
-        srcs = [test_file_name],
+        name = name,
+        srcs = ["check_suite.py"],
+        main = "check_suite.py",
+        args = args,
         deps = ["//:check"],
-        data = [vendor_file],
+        data = vendor_files,
+        size = size,
+        shard_count = min((len(vendor_files) + files_per_shard - 1) // files_per_shard, 50) if vendor_files else 1,
     )